@@ -1,5 +1,19 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
 from db.mongo import db
+from core.config import EMBEDDING_WARMUP
+from services.single_flight import single_flight_stats
+from services.cache import cache_stats
+from services.swr import swr_stats
+from services.prewarm import chart_prewarmer
+from services.ingest import ingest_queue
+from services.vector_index import vector_index
+from services.song_resolver import song_resolver
+from services.chart_datasets import chart_datasets
+from services.audio_stream_cache import audio_stream_cache
+from services.link_refresher import download_link_refresher
+from services.audio_features import audio_pipeline
+from app.utils import embedding_cache_stats, is_text_model_loaded
 
 router = APIRouter()
 
@@ -10,3 +24,51 @@ async def health():
         return {"status": "ok"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
+
+
+@router.get("/health/ready")
+async def ready():
+    """Readiness: only ready once the embedding model has been warmed up"""
+    if EMBEDDING_WARMUP and not is_text_model_loaded():
+        return JSONResponse(
+            status_code=503, content={"status": "starting", "model_loaded": False}
+        )
+    return {"status": "ready", "model_loaded": is_text_model_loaded()}
+
+
+@router.get("/health/stats")
+async def health_stats():
+    """In-process performance counters for this worker"""
+    return {
+        "single_flight": single_flight_stats(),
+        "l1_cache": cache_stats(),
+        "stale_while_revalidate": swr_stats(),
+        "chart_prewarm": chart_prewarmer.stats(),
+        "embedding_ingest": ingest_queue.stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "vector_index": vector_index.stats(),
+        "song_resolver": song_resolver.stats(),
+        "chart_datasets": chart_datasets.stats(),
+        "audio_stream_cache": audio_stream_cache.stats(),
+        "download_link_refresh": download_link_refresher.stats(),
+        "audio_features": audio_pipeline.stats(),
+    }
+
+
+@router.get("/health/similarity-recall")
+async def similarity_recall(
+    k: int = Query(10, ge=1, le=100),
+    shortlists: str = "20,50,100,200",
+    samples: int = Query(100, ge=1, le=1000),
+):
+    """recall@k of int8 similar-songs search against exact search"""
+    try:
+        sizes = sorted({int(size) for size in shortlists.split(",") if size})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="shortlists must be integers")
+    if not sizes:
+        raise HTTPException(status_code=400, detail="shortlists must not be empty")
+    result = await vector_index.evaluate_recall(k, sizes, samples)
+    if result is None:
+        raise HTTPException(status_code=503, detail="Vector index is not ready")
+    return result
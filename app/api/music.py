@@ -9,29 +9,45 @@ from fastapi import (
     BackgroundTasks,
     Body,
     Request,
+    Response,
 )
 from fastapi.responses import StreamingResponse
 import httpx
 from pydantic import BaseModel
-from models.tracks import Country, MusicTrack, Period, TrackSearch, TopTrendingTracks
+from models.tracks import (
+    Country,
+    MusicTrack,
+    Period,
+    SimilarSongsBatchRequest,
+    TrackIdsRequest,
+    TrackSearch,
+    TopTrendingTracks,
+)
 
+from services.audio_stream_cache import audio_stream_cache, parse_range
 from services.music_service import (
-    find_similar_songs,
-    find_similar_songs_atlas,
+    find_similar_songs_batch,
+    similar_songs_handler,
     search_music_handler,
     top_trending_tracks_handler,
     download_music_handler,
     get_track_lyrics_handler,
     get_popular_songs_handler,
-    get_popular_songs_from_api,
+    stream_popular_songs,
+    get_chart_songs_handler,
+    get_popular_albums_handler,
+    get_popular_artists_handler,
     get_music_infor_by_id,
     get_music_detail_by_id,
+    get_music_infor_by_ids,
+    get_music_details_by_ids,
 )
 from models.user import UserRole
 from api.deps import validate_role
 from datetime import datetime
 from db.mongo import search_history_collection
-from core.config import logger
+from core.config import logger, TRACKS_BATCH_MAX_IDS, SIMILAR_SONGS_BATCH_MAX_SEEDS
+import json
 import time
 import hashlib
 from pathlib import Path
@@ -83,6 +99,36 @@ async def get_music_detail(id: str) -> MusicTrack:
     return await get_music_detail_by_id(id)
 
 
+def _validate_batch_ids(data: TrackIdsRequest):
+    if not data.ids:
+        raise HTTPException(status_code=400, detail="ids is required")
+    if len(data.ids) > TRACKS_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {TRACKS_BATCH_MAX_IDS} ids per request",
+        )
+
+
+# Get music infor for many ids, in request order
+@router.post(
+    "/get-infor/batch",
+)
+async def get_music_infor_batch(data: TrackIdsRequest):
+    _validate_batch_ids(data)
+    return await get_music_infor_by_ids(data.ids)
+
+
+# Get music detail for many ids, in request order
+@router.post(
+    "/get-detail/batch",
+)
+async def get_music_detail_batch(
+    data: TrackIdsRequest,
+) -> List[Optional[MusicTrack]]:
+    _validate_batch_ids(data)
+    return await get_music_details_by_ids(data.ids)
+
+
 # Top 200 tracks
 @router.get(
     "/top-trending",
@@ -91,6 +137,7 @@ async def get_music_detail(id: str) -> MusicTrack:
     ],
 )
 async def top_trending_tracks(
+    response: Response,
     country: Country = Query(..., description="Country"),
     period: Period = Query(..., description="Period"),
 ):
@@ -98,7 +145,53 @@ async def top_trending_tracks(
         raise HTTPException(status_code=400, detail="Country is required")
 
     data = TopTrendingTracks(country=country, period=period)
-    return await top_trending_tracks_handler(data)
+    return await top_trending_tracks_handler(data, response)
+
+
+@router.get("/stream/{id}")
+async def stream_music(id: str, request: Request):
+    """Audio of a track from the local cache, with Range support.
+
+    The upstream file is downloaded once; requests arriving while it is
+    still downloading are streamed the part already on disk as it grows.
+    """
+    try:
+        audio = await audio_stream_cache.open(id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="No audio available for track")
+    except Exception as e:
+        logger.error(f"Error opening audio stream for {id}: {e}")
+        raise HTTPException(status_code=502, detail="Upstream audio unavailable")
+
+    headers = {}
+    if audio.size is not None:
+        headers["Accept-Ranges"] = "bytes"
+    try:
+        byte_range = parse_range(request.headers.get("range"), audio.size)
+    except ValueError:
+        raise HTTPException(
+            status_code=416, headers={"Content-Range": f"bytes */{audio.size}"}
+        )
+    if byte_range is None:
+        start, end, status_code = 0, None, 200
+        if audio.size is not None:
+            headers["Content-Length"] = str(audio.size)
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{audio.size}"
+        headers["Content-Length"] = str(end - start + 1)
+    try:
+        body = audio.read(start, end)
+    except OSError as e:
+        # Evicted, or the download failed, since it was opened
+        logger.error(f"Error reading audio for {id}: {e}")
+        raise HTTPException(status_code=502, detail="Upstream audio unavailable")
+    return StreamingResponse(
+        body,
+        status_code=status_code,
+        media_type=audio.content_type,
+        headers=headers,
+    )
 
 
 # Download music by id
@@ -117,6 +210,24 @@ async def get_track_lyrics(id: str):
     return await get_track_lyrics_handler(id)
 
 
+@router.post("/similar-songs/batch")
+async def get_similar_songs_batch(data: SimilarSongsBatchRequest):
+    """Find similar songs for many seed songs in one pass"""
+    if not data.ids:
+        raise HTTPException(status_code=400, detail="ids is required")
+    if len(data.ids) > SIMILAR_SONGS_BATCH_MAX_SEEDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {SIMILAR_SONGS_BATCH_MAX_SEEDS} seed ids per request",
+        )
+    filter_criteria = {}
+    if data.genre:
+        filter_criteria["genre"] = data.genre
+    return await find_similar_songs_batch(
+        data.ids, data.n, filter_criteria, merge=data.merge
+    )
+
+
 @router.get("/similar-songs/{song_id}")
 async def get_similar_songs(
     song_id: str, n: Optional[int] = Query(5, ge=1, le=50), genre: Optional[str] = None
@@ -127,12 +238,7 @@ async def get_similar_songs(
     if genre:
         filter_criteria["genre"] = genre
 
-    # Use MongoDB Atlas vector search if available
-    try:
-        similar_songs = await find_similar_songs_atlas(song_id, n, filter_criteria)
-    except Exception as e:
-        # Fall back to custom implementation
-        similar_songs = await find_similar_songs(song_id, n, filter_criteria)
+    similar_songs = await similar_songs_handler(song_id, n, filter_criteria)
 
     if not similar_songs:
         raise HTTPException(
@@ -145,7 +251,58 @@ async def get_similar_songs(
 
 @router.get("/popular-songs")
 async def get_popular_songs(
+    response: Response,
     country: Country = Query(..., description="Country"),
 ):
     """Get popular songs with optional background processing"""
-    return await get_popular_songs_handler(country)
+    return await get_popular_songs_handler(country, response)
+
+
+@router.get("/popular-songs/chart")
+async def get_chart_songs(
+    country: Country = Query(..., description="Country"),
+    genre: Optional[str] = None,
+    artist: Optional[str] = None,
+    year: Optional[str] = None,
+):
+    """Chart songs (title and artist, unresolved) filtered by genre, artist, year"""
+    songs = get_chart_songs_handler(country, genre, artist, year)
+    if songs is None:
+        raise HTTPException(status_code=404, detail="No song chart available")
+    return songs
+
+
+@router.get("/popular-albums")
+async def get_popular_albums(country: Country = Query(..., description="Country")):
+    """Popular albums of a country"""
+    albums = get_popular_albums_handler(country)
+    if albums is None:
+        raise HTTPException(status_code=404, detail="No album chart for country")
+    return albums
+
+
+@router.get("/popular-artists")
+async def get_popular_artists(country: Country = Query(..., description="Country")):
+    """Popular artists of a country"""
+    artists = get_popular_artists_handler(country)
+    if artists is None:
+        raise HTTPException(status_code=404, detail="No artist chart for country")
+    return artists
+
+
+@router.get("/popular-songs/stream")
+async def stream_popular_songs_endpoint(
+    country: Country = Query(..., description="Country"),
+    format: str = Query("ndjson", regex="^(ndjson|sse)$"),
+):
+    """Stream popular songs as they resolve, one {index, item, total} per event"""
+
+    async def events():
+        async for event in stream_popular_songs(country):
+            data = json.dumps(event, default=str)
+            yield f"data: {data}\n\n" if format == "sse" else f"{data}\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        events(), media_type=media_type, headers={"Cache-Control": "no-cache"}
+    )
@@ -21,3 +21,180 @@ RAPID_API_URL = os.getenv("RAPID_API_URL")
 RAPID_API_DOWNLOAD_URL = os.getenv("RAPID_API_DOWNLOAD_URL")
 RAPID_API_DOWNLOAD_HOST = os.getenv("RAPID_API_DOWNLOAD_HOST")
 CACHE_EXPIRE_TIME = 30
+
+# Upstream HTTP client (RapidAPI)
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "20"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5"))
+UPSTREAM_MAX_CONNECTIONS_PER_HOST = int(
+    os.getenv("UPSTREAM_MAX_CONNECTIONS_PER_HOST", "20")
+)
+UPSTREAM_MAX_KEEPALIVE_PER_HOST = int(
+    os.getenv("UPSTREAM_MAX_KEEPALIVE_PER_HOST", "10")
+)
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+
+# In-process L1 cache in front of search_history_collection (TTLs in seconds)
+L1_CACHE_MAX_ENTRIES = int(os.getenv("L1_CACHE_MAX_ENTRIES", "5000"))
+L1_CACHE_TTL_TRACK_INFO = int(os.getenv("L1_CACHE_TTL_TRACK_INFO", "3600"))
+L1_CACHE_TTL_LYRICS = int(os.getenv("L1_CACHE_TTL_LYRICS", "3600"))
+L1_CACHE_TTL_DOWNLOAD = int(os.getenv("L1_CACHE_TTL_DOWNLOAD", "300"))
+L1_CACHE_TTL_QUERY = int(os.getenv("L1_CACHE_TTL_QUERY", "600"))
+L1_CACHE_TTL_DEFAULT = int(os.getenv("L1_CACHE_TTL_DEFAULT", "300"))
+
+# Per-part upstream timeout when assembling /music/get-detail (seconds)
+DETAIL_PART_TIMEOUT = float(os.getenv("DETAIL_PART_TIMEOUT", "10"))
+
+# Batch track endpoints
+TRACKS_UPSTREAM_BATCH_SIZE = int(os.getenv("TRACKS_UPSTREAM_BATCH_SIZE", "50"))
+TRACKS_BATCH_MAX_IDS = int(os.getenv("TRACKS_BATCH_MAX_IDS", "100"))
+DETAIL_BATCH_CONCURRENCY = int(os.getenv("DETAIL_BATCH_CONCURRENCY", "5"))
+
+# Background embedding ingest
+INGEST_QUEUE_MAXSIZE = int(os.getenv("INGEST_QUEUE_MAXSIZE", "2000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_BATCH_WAIT = float(os.getenv("INGEST_BATCH_WAIT", "0.5"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_SHUTDOWN_TIMEOUT = float(os.getenv("INGEST_SHUTDOWN_TIMEOUT", "30"))
+
+# Text embedding model; bump EMBEDDING_VERSION to invalidate stored embeddings
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_VERSION = os.getenv("EMBEDDING_VERSION", "1")
+EMBEDDING_MODEL_TAG = f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_VERSION}"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+# Load the embedding model in the background at startup instead of on first use
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "true").lower() == "true"
+
+# Local data directory for on-disk indexes and caches
+DATA_DIR = os.getenv(
+    "DATA_DIR",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+        "data",
+    ),
+)
+
+# Local ANN (IVF-flat) index used when Atlas $vectorSearch is unavailable
+VECTOR_INDEX_PATH = os.getenv(
+    "VECTOR_INDEX_PATH", os.path.join(DATA_DIR, "vector_index.npz")
+)
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+VECTOR_INDEX_SYNC_INTERVAL = float(os.getenv("VECTOR_INDEX_SYNC_INTERVAL", "60"))
+VECTOR_INDEX_FILTER_FIELDS = [
+    field
+    for field in os.getenv("VECTOR_INDEX_FILTER_FIELDS", "genre").split(",")
+    if field
+]
+
+# Memory-mapped float32 embedding store shared by all workers on a host
+EMBEDDING_STORE_DIR = os.getenv(
+    "EMBEDDING_STORE_DIR", os.path.join(DATA_DIR, "embedding_store")
+)
+# Catalogs up to this size are searched exactly instead of through IVF lists
+EXACT_SEARCH_MAX_ROWS = int(os.getenv("EXACT_SEARCH_MAX_ROWS", "200000"))
+# Compact the store at startup once this fraction of rows is tombstoned
+EMBEDDING_STORE_COMPACT_RATIO = float(os.getenv("EMBEDDING_STORE_COMPACT_RATIO", "0.3"))
+
+# How track embeddings are stored in tracks_collection: "array" (BSON doubles,
+# required by Atlas $vectorSearch), or packed "float32" / "float16" binary
+EMBEDDING_STORAGE_FORMAT = os.getenv("EMBEDDING_STORAGE_FORMAT", "array")
+
+# Similar-songs scoring: "float32" scores the mapped float32 store directly,
+# "int8" shortlists with quantized vectors and re-ranks at full precision
+SIMILARITY_MODE = os.getenv("SIMILARITY_MODE", "float32")
+# Candidates re-ranked at full precision in int8 mode (at least n)
+QUANTIZED_SHORTLIST = int(os.getenv("QUANTIZED_SHORTLIST", "100"))
+# Seed ids accepted by POST /music/similar-songs/batch
+SIMILAR_SONGS_BATCH_MAX_SEEDS = int(os.getenv("SIMILAR_SONGS_BATCH_MAX_SEEDS", "100"))
+
+# Similar-songs result cache; entries are keyed by catalog generation, so the
+# TTL only bounds how long superseded entries linger
+SIMILAR_SONGS_CACHE_TTL = int(os.getenv("SIMILAR_SONGS_CACHE_TTL", "86400"))
+# How long a worker trusts its copy of the catalog generation counter
+CATALOG_GENERATION_TTL = float(os.getenv("CATALOG_GENERATION_TTL", "5"))
+
+# Audio feature extraction: decoded in blocks of this many STFT frames and run
+# in a process pool (defaults to one process per core)
+AUDIO_BLOCK_FRAMES = int(os.getenv("AUDIO_BLOCK_FRAMES", "256"))
+AUDIO_FEATURE_WORKERS = (
+    int(os.getenv("AUDIO_FEATURE_WORKERS", "0")) or os.cpu_count() or 1
+)
+AUDIO_FEATURES_DIR = os.getenv(
+    "AUDIO_FEATURES_DIR", os.path.join(DATA_DIR, "audio_features")
+)
+
+# Chroma fingerprint de-duplication: the Hamming distance still counted as a
+# duplicate, LSH bands over the 288-bit fingerprint (by default one more than
+# that distance, so no such pair is missed) and the largest duration
+# difference allowed between duplicates
+DEDUP_MAX_HAMMING = int(os.getenv("DEDUP_MAX_HAMMING", "24"))
+DEDUP_LSH_BANDS = int(os.getenv("DEDUP_LSH_BANDS", "0")) or DEDUP_MAX_HAMMING + 1
+DEDUP_MAX_DURATION_DIFF_MS = int(os.getenv("DEDUP_MAX_DURATION_DIFF_MS", "5000"))
+
+# Stale-while-revalidate charts: served from cache without refreshing for the
+# fresh TTL, then served stale while one background refresh runs, until the
+# hard TTL (top-200 keeps CACHE_EXPIRE_TIME days)
+TOP_TRACKS_FRESH_TTL = int(os.getenv("TOP_TRACKS_FRESH_TTL", "21600"))
+POPULAR_SONGS_FRESH_TTL = int(os.getenv("POPULAR_SONGS_FRESH_TTL", "86400"))
+POPULAR_SONGS_TTL = int(os.getenv("POPULAR_SONGS_TTL", "604800"))
+
+# Chart pre-warming: one worker across replicas (Mongo lease lock) refreshes
+# every top-200 chart and popular-songs list before it turns stale
+CHART_PREWARM_ENABLED = os.getenv("CHART_PREWARM_ENABLED", "true").lower() == "true"
+CHART_PREWARM_INTERVAL = int(os.getenv("CHART_PREWARM_INTERVAL", "3600"))
+CHART_PREWARM_JITTER = int(os.getenv("CHART_PREWARM_JITTER", "120"))
+# Local hour after which the upstream has published the previous day's charts
+CHART_PUBLISH_HOUR = int(os.getenv("CHART_PUBLISH_HOUR", "1"))
+# Weekday (Monday is 0) on which the upstream publishes the weekly charts
+CHART_PUBLISH_WEEKDAY = int(os.getenv("CHART_PUBLISH_WEEKDAY", "3"))
+CHART_PREWARM_LOCK_LEASE = int(os.getenv("CHART_PREWARM_LOCK_LEASE", "900"))
+# On a cold popular-songs cache, return what resolved within this many seconds
+POPULAR_SONGS_PARTIAL_WAIT = float(os.getenv("POPULAR_SONGS_PARTIAL_WAIT", "2"))
+
+# Chart song resolution: stored tracks by the same primary artist whose
+# normalized title is at least this similar count as the song
+SONG_RESOLVER_FUZZY_THRESHOLD = float(
+    os.getenv("SONG_RESOLVER_FUZZY_THRESHOLD", "0.85")
+)
+SONG_RESOLVER_FUZZY_CANDIDATES = int(os.getenv("SONG_RESOLVER_FUZZY_CANDIDATES", "200"))
+
+# Chart datasets (popular songs, albums and artists) loaded from MOCKS_DIR at
+# startup; files are re-checked for changes every poll interval
+MOCKS_DIR = os.getenv(
+    "MOCKS_DIR",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+        "mocks",
+    ),
+)
+CHART_DATASETS_POLL_INTERVAL = int(os.getenv("CHART_DATASETS_POLL_INTERVAL", "30"))
+
+# Audio streaming proxy: upstream audio is downloaded once into an on-disk
+# LRU cache and served from there. AUDIO_CACHE_MAX_BYTES is the budget of each
+# worker, so the shared directory can hold workers x AUDIO_CACHE_MAX_BYTES
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join(DATA_DIR, "audio_cache"))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(2 * 1024**3)))
+AUDIO_STREAM_CHUNK_BYTES = int(os.getenv("AUDIO_STREAM_CHUNK_BYTES", str(64 * 1024)))
+
+# Download links expire upstream after DOWNLOAD_LINK_TTL seconds. Links of
+# hot tracks (decayed access score of at least DOWNLOAD_LINK_HOT_MIN_SCORE)
+# are renewed within DOWNLOAD_LINK_REFRESH_LEAD seconds of expiring
+DOWNLOAD_LINK_TTL = int(os.getenv("DOWNLOAD_LINK_TTL", "840"))
+DOWNLOAD_LINK_REFRESH_ENABLED = (
+    os.getenv("DOWNLOAD_LINK_REFRESH_ENABLED", "true").lower() == "true"
+)
+DOWNLOAD_LINK_REFRESH_INTERVAL = int(os.getenv("DOWNLOAD_LINK_REFRESH_INTERVAL", "30"))
+DOWNLOAD_LINK_REFRESH_LEAD = int(os.getenv("DOWNLOAD_LINK_REFRESH_LEAD", "90"))
+DOWNLOAD_LINK_REFRESH_CONCURRENCY = int(
+    os.getenv("DOWNLOAD_LINK_REFRESH_CONCURRENCY", "3")
+)
+DOWNLOAD_LINK_REFRESH_MAX_PER_ROUND = int(
+    os.getenv("DOWNLOAD_LINK_REFRESH_MAX_PER_ROUND", "50")
+)
+DOWNLOAD_LINK_HOT_MIN_SCORE = float(os.getenv("DOWNLOAD_LINK_HOT_MIN_SCORE", "3"))
+DOWNLOAD_LINK_HOT_HALF_LIFE = int(os.getenv("DOWNLOAD_LINK_HOT_HALF_LIFE", "1800"))
+# Upper bound on one sweep; a worker that dies mid-sweep holds the lock this long
+DOWNLOAD_LINK_REFRESH_LOCK_LEASE = int(
+    os.getenv("DOWNLOAD_LINK_REFRESH_LOCK_LEASE", "300")
+)
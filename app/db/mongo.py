@@ -8,3 +8,6 @@ verification_codes_collection = db.get_collection("verification_codes")
 tracks_collection = db.get_collection("tracks")
 search_history_collection = db.get_collection("search_history")
 playlists_collection = db.get_collection("playlists")
+counters_collection = db.get_collection("counters")
+locks_collection = db.get_collection("locks")
+song_resolutions_collection = db.get_collection("song_resolutions")
@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from api import audius
@@ -6,8 +8,57 @@ from api import auth
 from api import music
 from api import health
 from api import playlist
+from services import upstream
+from services.ingest import ingest_queue
+from services.vector_index import vector_index
+from services.song_resolver import song_resolver
+from services.chart_datasets import chart_datasets
+from services.audio_stream_cache import audio_stream_cache
+from services.link_refresher import download_link_refresher
+from services.audio_features import audio_pipeline
+from services.prewarm import chart_prewarmer
+from app.utils import get_text_model
+from core.config import (
+    logger,
+    EMBEDDING_WARMUP,
+    CHART_PREWARM_ENABLED,
+    DOWNLOAD_LINK_REFRESH_ENABLED,
+)
+
+
+def _log_warmup_result(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Embedding model warm-up failed: {future.exception()}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstream.startup()
+    await ingest_queue.start()
+    await vector_index.start()
+    await song_resolver.start()
+    await chart_datasets.start()
+    await audio_stream_cache.start()
+    if EMBEDDING_WARMUP:
+        # Load the model off the event loop; /health/ready reports when done
+        warmup = asyncio.get_running_loop().run_in_executor(None, get_text_model)
+        warmup.add_done_callback(_log_warmup_result)
+    if CHART_PREWARM_ENABLED:
+        await chart_prewarmer.start()
+    if DOWNLOAD_LINK_REFRESH_ENABLED:
+        await download_link_refresher.start()
+    yield
+    await chart_prewarmer.stop()
+    await download_link_refresher.stop()
+    await chart_datasets.stop()
+    await audio_stream_cache.stop()
+    await ingest_queue.stop()
+    await vector_index.stop()
+    audio_pipeline.stop()
+    await upstream.shutdown()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -18,6 +18,8 @@ from .tracks import (
     Duration,
     Playability,
     TrackSearch,
+    TrackIdsRequest,
+    SimilarSongsBatchRequest,
     TrendingTrack,
     TrendingTracksResponse,
     TrendingTrackMetadata,
@@ -52,6 +54,8 @@ __all__ = [
     "Duration",
     "Playability",
     "TrackSearch",
+    "TrackIdsRequest",
+    "SimilarSongsBatchRequest",
     "TrendingTrack",
     "TrendingTracksResponse",
     "TrendingTrackMetadata",
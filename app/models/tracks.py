@@ -1,5 +1,5 @@
 from enum import Enum
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Any, Dict
 from .albums import Album, Artists
 from datetime import date, datetime
@@ -63,6 +63,17 @@ class TracksResponse(BaseModel):
     tracks: Optional[TrackList] = None
 
 
+class TrackIdsRequest(BaseModel):
+    ids: List[str]
+
+
+class SimilarSongsBatchRequest(BaseModel):
+    ids: List[str]
+    n: int = Field(5, ge=1, le=50)
+    genre: Optional[str] = None
+    merge: bool = False
+
+
 class TrackSearch(BaseModel):
     query: str
     limit: Optional[int] = 20
@@ -218,6 +229,16 @@ class PopularSongsResponse(BaseModel):
         return self.dict(exclude_none=True)
 
 
+class PopularAlbum(BaseModel):
+    id: str
+    name: str
+
+
+class PopularArtist(BaseModel):
+    id: str
+    name: str
+
+
 class MusicTrack(BaseModel):
     """Music track model with all fields required for the frontend."""
 
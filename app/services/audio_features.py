@@ -0,0 +1,401 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import (
+    logger,
+    AUDIO_BLOCK_FRAMES,
+    AUDIO_FEATURE_WORKERS,
+    AUDIO_FEATURES_DIR,
+)
+
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+N_MFCC = 13
+# Bump when the extractor changes so stored features are recomputed
+FEATURE_VERSION = 3
+# The chroma fingerprint covers FINGERPRINT_SEGMENTS consecutive segments of
+# FINGERPRINT_SEGMENT_SECONDS each, from the first frame louder than
+# FINGERPRINT_SILENCE_RMS: 12 bits per segment, 288 in all
+FINGERPRINT_SEGMENTS = 24
+FINGERPRINT_SEGMENT_SECONDS = 1.0
+FINGERPRINT_SILENCE_RMS = 10 ** (-50 / 20)
+# Bytes hashed from the start, middle and end of a file for its fingerprint
+FINGERPRINT_CHUNK = 64 * 1024
+
+
+class ChromaSequence:
+    """Time-ordered chroma fingerprint, fed one block of frames at a time.
+
+    Starting at the first frame louder than FINGERPRINT_SILENCE_RMS (so
+    leading silence does not shift it), chroma is averaged over segments of
+    segment_frames frames. Each segment contributes the 12 bits of which
+    pitch classes are above its mean, in order, so the fingerprint follows
+    the chord progression rather than the overall pitch content.
+    """
+
+    def __init__(self, segment_frames: int, segments: int):
+        self.segment_frames = max(1, segment_frames)
+        self.segments = segments
+        self.started = False
+        self.means: List[np.ndarray] = []
+        self._sum = np.zeros(12)
+        self._count = 0
+
+    def add(self, chroma: np.ndarray, rms: np.ndarray):
+        if len(self.means) >= self.segments:
+            return
+        if not self.started:
+            loud = np.flatnonzero(rms > FINGERPRINT_SILENCE_RMS)
+            if not len(loud):
+                return
+            self.started = True
+            chroma = chroma[:, loud[0] :]
+        while chroma.shape[1] and len(self.means) < self.segments:
+            take = min(self.segment_frames - self._count, chroma.shape[1])
+            self._sum += chroma[:, :take].sum(axis=1)
+            self._count += take
+            chroma = chroma[:, take:]
+            if self._count == self.segment_frames:
+                self.means.append(self._sum / self._count)
+                self._sum = np.zeros(12)
+                self._count = 0
+
+    def fingerprint(self) -> bytes:
+        """12 bits per segment, or b"" if the track was too short"""
+        if len(self.means) < self.segments:
+            return b""
+        means = np.array(self.means)
+        bits = means > means.mean(axis=1, keepdims=True)
+        return np.packbits(bits.ravel()).tobytes()
+
+
+def analyse_audio(
+    audio_path: str, block_length: int = AUDIO_BLOCK_FRAMES
+) -> Tuple[np.ndarray, bytes]:
+    """Feature vector and chroma fingerprint of a track, streamed in blocks.
+
+    Audio is decoded block_length frames at a time at its native sample
+    rate. Each block shares one STFT across the features, and only running
+    sums (and the one-value-per-frame onset envelope for tempo) are kept,
+    so memory does not grow with track length.
+
+    The features are the MFCC, chroma and spectral-contrast means plus
+    tempo. The fingerprint (see ChromaSequence) is time-ordered, so songs
+    that merely share a key and harmony do not match; it is empty for
+    tracks too short to fill it.
+    """
+    import librosa
+
+    sr = librosa.get_samplerate(audio_path)
+    stream = librosa.stream(
+        audio_path,
+        block_length=block_length,
+        frame_length=FRAME_LENGTH,
+        hop_length=HOP_LENGTH,
+        mono=True,
+        fill_value=0,
+    )
+
+    sums = None
+    frames = 0
+    onset_envelope = []
+    sequence = ChromaSequence(
+        round(sr * FINGERPRINT_SEGMENT_SECONDS / HOP_LENGTH), FINGERPRINT_SEGMENTS
+    )
+    for block in stream:
+        power = (
+            np.abs(
+                librosa.stft(
+                    block, n_fft=FRAME_LENGTH, hop_length=HOP_LENGTH, center=False
+                )
+            )
+            ** 2
+        )
+        log_mel = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sr))
+        chroma = librosa.feature.chroma_stft(S=power, sr=sr)
+        block_features = np.vstack(
+            [
+                librosa.feature.mfcc(S=log_mel, n_mfcc=N_MFCC),
+                chroma,
+                librosa.feature.spectral_contrast(S=np.sqrt(power), sr=sr),
+            ]
+        )
+        block_sums = block_features.sum(axis=1)
+        sums = block_sums if sums is None else sums + block_sums
+        frames += block_features.shape[1]
+        onset_envelope.append(librosa.onset.onset_strength(S=log_mel, sr=sr))
+        sequence.add(
+            chroma, librosa.feature.rms(S=np.sqrt(power), frame_length=FRAME_LENGTH)[0]
+        )
+
+    if not frames:
+        raise ValueError(f"No audio decoded from {audio_path}")
+    tempo = librosa.feature.tempo(
+        onset_envelope=np.concatenate(onset_envelope), sr=sr, hop_length=HOP_LENGTH
+    )[0]
+    # Same layout as before: 13 MFCC, 12 chroma, 7 contrast, tempo / 200
+    features = np.hstack([sums / frames, [tempo / 200.0]])
+    return features, sequence.fingerprint()
+
+
+def extract_audio_features(audio_path: str, block_length: int = AUDIO_BLOCK_FRAMES):
+    """MFCC, chroma and spectral-contrast means plus tempo (see analyse_audio)"""
+    return analyse_audio(audio_path, block_length)[0]
+
+
+def audio_fingerprint(audio_path: str) -> str:
+    """Content fingerprint from the file size and three sampled byte ranges.
+
+    Cheap compared to decoding, and identical for byte-identical audio
+    stored under different track ids.
+    """
+    size = os.path.getsize(audio_path)
+    digest = hashlib.sha1(str(size).encode("utf-8"))
+    with open(audio_path, "rb") as f:
+        middle = max(0, size // 2 - FINGERPRINT_CHUNK // 2)
+        for offset in (0, middle, max(0, size - FINGERPRINT_CHUNK)):
+            f.seek(offset)
+            digest.update(f.read(FINGERPRINT_CHUNK))
+    return digest.hexdigest()
+
+
+class AudioFeatureStore:
+    """Audio features and hybrid embeddings keyed by audio fingerprint.
+
+    Features live in <fingerprint>.npz together with the chroma fingerprint
+    and the seconds it took to extract them. Hybrid embeddings also depend on
+    the metadata text, so they are stored per (fingerprint, embedding text
+    hash).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write(self, name: str, **arrays):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, version=np.array(FEATURE_VERSION), **arrays)
+        os.replace(tmp_path, path)
+
+    def _read(self, name: str) -> Optional[Dict[str, np.ndarray]]:
+        try:
+            with np.load(self._path(name)) as data:
+                if int(data["version"]) != FEATURE_VERSION:
+                    return None
+                return {key: data[key] for key in data.files}
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+    def get(self, fingerprint: str) -> Optional[Tuple[np.ndarray, float]]:
+        """(features, seconds spent extracting them) or None"""
+        data = self._read(f"{fingerprint}.npz")
+        if data is None:
+            return None
+        return data["features"], float(data["extract_seconds"])
+
+    def get_chroma(self, fingerprint: str) -> Optional[bytes]:
+        data = self._read(f"{fingerprint}.npz")
+        return None if data is None else data["chroma"].tobytes()
+
+    def put(
+        self,
+        fingerprint: str,
+        features: np.ndarray,
+        chroma: bytes,
+        extract_seconds: float,
+    ):
+        self._write(
+            f"{fingerprint}.npz",
+            features=np.asarray(features, dtype=np.float64),
+            chroma=np.frombuffer(chroma, dtype=np.uint8),
+            extract_seconds=np.array(extract_seconds),
+        )
+
+    def get_embedding(self, fingerprint: str, text_hash: str) -> Optional[np.ndarray]:
+        data = self._read(f"{fingerprint}.{text_hash}.npz")
+        return None if data is None else data["embedding"]
+
+    def put_embedding(self, fingerprint: str, text_hash: str, embedding):
+        self._write(
+            f"{fingerprint}.{text_hash}.npz",
+            embedding=np.asarray(embedding, dtype=np.float64),
+        )
+
+
+def _timed_analyse(audio_path: str) -> Tuple[np.ndarray, bytes, float]:
+    started = time.perf_counter()
+    features, chroma = analyse_audio(audio_path)
+    return features, chroma, time.perf_counter() - started
+
+
+class AudioFeaturePipeline:
+    """Extracts audio features for many tracks in a process pool.
+
+    Work is keyed by audio fingerprint: audio already in the store is not
+    decoded again, and tracks sharing identical audio are extracted once.
+    The pool uses spawned processes (the server has threads, so forking is
+    unsafe) and is created on first use.
+    """
+
+    def __init__(self, store: AudioFeatureStore, workers: int):
+        self.store = store
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # (path, size, mtime) -> fingerprint, so unchanged files are not re-read
+        self._fingerprints: Dict[Tuple[str, int, int], str] = {}
+        self.extracted = 0
+        self.feature_hits = 0
+        self.embedding_hits = 0
+        self.embedding_misses = 0
+        self.failed = 0
+        self.extract_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def fingerprint(self, audio_path: str) -> str:
+        stat = os.stat(audio_path)
+        key = (audio_path, stat.st_size, stat.st_mtime_ns)
+        fingerprint = self._fingerprints.get(key)
+        if fingerprint is None:
+            fingerprint = audio_fingerprint(audio_path)
+            self._fingerprints[key] = fingerprint
+        return fingerprint
+
+    def _stored_features(self, fingerprint: str) -> Optional[np.ndarray]:
+        stored = self.store.get(fingerprint)
+        if stored is None:
+            return None
+        features, extract_seconds = stored
+        self.feature_hits += 1
+        self.saved_seconds += extract_seconds
+        return features
+
+    async def extract_many(self, audio_paths: Dict[str, str]) -> Dict[str, np.ndarray]:
+        """Features for {track_id: audio_path}; failed tracks are left out"""
+        results = {}
+        by_fingerprint: Dict[str, List[str]] = {}
+        pending: Dict[str, str] = {}
+        for track_id, audio_path in audio_paths.items():
+            try:
+                fingerprint = self.fingerprint(audio_path)
+            except OSError as e:
+                self.failed += 1
+                logger.error(f"Error reading audio for {track_id}: {e}")
+                continue
+            by_fingerprint.setdefault(fingerprint, []).append(track_id)
+            if fingerprint in pending:
+                continue
+            features = self._stored_features(fingerprint)
+            if features is None:
+                pending[fingerprint] = audio_path
+            else:
+                results[track_id] = features
+
+        if pending:
+            loop = asyncio.get_running_loop()
+            pool = self._pool()
+            outcomes = await asyncio.gather(
+                *(
+                    loop.run_in_executor(pool, _timed_analyse, audio_path)
+                    for audio_path in pending.values()
+                ),
+                return_exceptions=True,
+            )
+            for fingerprint, outcome in zip(pending, outcomes):
+                if isinstance(outcome, Exception):
+                    self.failed += 1
+                    logger.error(f"Error extracting audio features: {outcome}")
+                    continue
+                features, chroma, extract_seconds = outcome
+                self.store.put(fingerprint, features, chroma, extract_seconds)
+                self.extracted += 1
+                self.extract_seconds += extract_seconds
+                # Every track id after the first reuses the one extraction
+                self.saved_seconds += extract_seconds * (
+                    len(by_fingerprint[fingerprint]) - 1
+                )
+                results[by_fingerprint[fingerprint][0]] = features
+
+        for track_ids in by_fingerprint.values():
+            if track_ids[0] in results:
+                for track_id in track_ids:
+                    results[track_id] = results[track_ids[0]]
+        return results
+
+    def features_for(self, audio_path: str) -> np.ndarray:
+        """Stored features for one audio file, extracting in-process on a miss"""
+        fingerprint = self.fingerprint(audio_path)
+        features = self._stored_features(fingerprint)
+        if features is not None:
+            return features
+        features, chroma, extract_seconds = _timed_analyse(audio_path)
+        self.store.put(fingerprint, features, chroma, extract_seconds)
+        self.extracted += 1
+        self.extract_seconds += extract_seconds
+        return features
+
+    async def chroma_fingerprints(
+        self, audio_paths: Dict[str, str]
+    ) -> Dict[str, bytes]:
+        """Chroma fingerprints for {track_id: audio_path}, extracting as needed"""
+        features = await self.extract_many(audio_paths)
+        fingerprints = {}
+        for track_id in features:
+            chroma = self.store.get_chroma(self.fingerprint(audio_paths[track_id]))
+            # Tracks too short for a fingerprint are never de-duplicated
+            if chroma:
+                fingerprints[track_id] = chroma
+        return fingerprints
+
+    def cached_embedding(self, audio_path: str, text_hash: str) -> Optional[np.ndarray]:
+        """Hybrid embedding stored for this audio and metadata text, if any"""
+        embedding = self.store.get_embedding(self.fingerprint(audio_path), text_hash)
+        if embedding is None:
+            self.embedding_misses += 1
+        else:
+            self.embedding_hits += 1
+        return embedding
+
+    def save_embedding(self, audio_path: str, text_hash: str, embedding):
+        self.store.put_embedding(self.fingerprint(audio_path), text_hash, embedding)
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": self.workers,
+            "extracted": self.extracted,
+            "feature_hits": self.feature_hits,
+            "embedding_hits": self.embedding_hits,
+            "embedding_misses": self.embedding_misses,
+            "failed": self.failed,
+            "extract_seconds": round(self.extract_seconds, 4),
+            "saved_seconds": round(self.saved_seconds, 4),
+        }
+
+
+audio_pipeline = AudioFeaturePipeline(
+    AudioFeatureStore(AUDIO_FEATURES_DIR), AUDIO_FEATURE_WORKERS
+)
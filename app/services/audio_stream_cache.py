@@ -0,0 +1,357 @@
+import asyncio
+import glob
+import hashlib
+import mimetypes
+import os
+import time
+import weakref
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from core.config import (
+    logger,
+    AUDIO_CACHE_DIR,
+    AUDIO_CACHE_MAX_BYTES,
+    AUDIO_STREAM_CHUNK_BYTES,
+)
+from services import upstream
+from services.music_service import get_download_link
+
+DEFAULT_CONTENT_TYPE = "audio/mpeg"
+# Partial downloads older than this were left behind by a stopped worker
+STALE_PART_SECONDS = 3600
+# Upstream statuses of an expired download link
+EXPIRED_LINK_STATUSES = (403, 404, 410)
+
+
+def parse_range(
+    header: Optional[str], size: Optional[int]
+) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single "bytes=" Range header.
+
+    None means the whole file should be sent: no header, an unknown size,
+    or a header that is ignored (malformed, last byte before first byte, or
+    multiple ranges). Raises ValueError for a range outside the file.
+    """
+    if not header or size is None:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        first = int(first) if first else None
+        last = int(last) if last else None
+    except ValueError:
+        return None
+    if (first is None and last is None) or min(first or 0, last or 0) < 0:
+        return None
+    if first is None:
+        if last == 0:
+            raise ValueError(f"Unsatisfiable range {header}")
+        start, end = max(size - last, 0), size - 1
+    elif last is not None and last < first:
+        # Syntactically invalid, so the header is ignored (RFC 9110 14.1.1)
+        return None
+    else:
+        start = first
+        end = size - 1 if last is None else min(last, size - 1)
+    if start >= size:
+        raise ValueError(f"Unsatisfiable range {header}")
+    return start, end
+
+
+async def _read_file(fd: int, start: int, stop: int) -> AsyncIterator[bytes]:
+    """Bytes [start, stop) of an open file, read off the event loop"""
+    loop = asyncio.get_running_loop()
+    position = start
+    while position < stop:
+        length = min(AUDIO_STREAM_CHUNK_BYTES, stop - position)
+        chunk = await loop.run_in_executor(None, os.pread, fd, length, position)
+        if not chunk:
+            raise IOError(f"Audio file ended at {position} of {stop} bytes")
+        position += len(chunk)
+        yield chunk
+
+
+class _OpenFile:
+    """A read-only descriptor, opened up front so that a file unlinked
+    afterwards (a failed fill, an eviction) stays readable. Closed once: when
+    its reader finishes, or when it is dropped if the reader never started."""
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.close = weakref.finalize(self, os.close, self.fd)
+
+
+def _write(f, chunk: bytes):
+    f.write(chunk)
+    # Readers of the partial file see every byte counted in written
+    f.flush()
+
+
+class CachedAudio:
+    """A fully downloaded track in the cache"""
+
+    def __init__(self, path: str, size: int, content_type: str):
+        self.path = path
+        self.size = size
+        self.content_type = content_type
+
+    def read(self, start: int = 0, end: Optional[int] = None):
+        """Bytes start..end; the file is opened before this returns"""
+        return self._read(_OpenFile(self.path), start, end)
+
+    async def _read(self, file: _OpenFile, start: int, end: Optional[int]):
+        try:
+            stop = self.size if end is None else end + 1
+            async for chunk in _read_file(file.fd, start, stop):
+                yield chunk
+        finally:
+            file.close()
+
+
+class AudioFill:
+    """An upstream download being written to the cache.
+
+    Readers can attach at any time: they are served what is already on disk
+    and then wait for the download to make progress, so concurrent requests
+    for a track that is still downloading never go to the upstream again.
+    """
+
+    def __init__(self, id: str, path: str):
+        self.id = id
+        self.path = path  # the partial file, then the cached file once done
+        self.size: Optional[int] = None
+        self.content_type = DEFAULT_CONTENT_TYPE
+        self.written = 0
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.ready = asyncio.Event()  # set once the upstream responded
+        self.task: Optional[asyncio.Task] = None
+        self._progress = asyncio.Condition()
+
+    async def advance(self, written: int = 0, done: bool = False, error=None):
+        async with self._progress:
+            self.written += written
+            self.done = self.done or done
+            self.error = self.error or error
+            self._progress.notify_all()
+
+    def read(self, start: int = 0, end: Optional[int] = None):
+        """Bytes start..end as they are downloaded; the partial file is
+        opened before this returns, so a failed fill deleting it cannot pull
+        it away from a response that already started"""
+        return self._read(_OpenFile(self.path), start, end)
+
+    async def _read(self, file: _OpenFile, start: int, end: Optional[int]):
+        try:
+            position = start
+            while end is None or position <= end:
+                async with self._progress:
+                    await self._progress.wait_for(
+                        lambda: self.written > position or self.done or self.error
+                    )
+                if self.error is not None:
+                    raise self.error
+                if position >= self.written:
+                    return
+                stop = self.written if end is None else min(self.written, end + 1)
+                async for chunk in _read_file(file.fd, position, stop):
+                    yield chunk
+                position = stop
+        finally:
+            file.close()
+
+
+class AudioStreamCache:
+    """Size-bounded on-disk LRU cache of upstream track audio.
+
+    A track is downloaded from the upstream once per worker (concurrent
+    requests share the download and read it while it fills); afterwards it
+    is served from local disk until evicted as least recently used.
+    Finished files are moved into place atomically, so workers sharing the
+    directory find each other's files.
+
+    max_bytes is each worker's own budget: workers count only the files
+    they downloaded or served, so a directory shared by N workers can grow
+    to N * max_bytes. Size AUDIO_CACHE_MAX_BYTES for that.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._files: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._fills: Dict[str, AudioFill] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.joined = 0
+        self.misses = 0
+        self.fills = 0
+        self.fill_failures = 0
+        self.evictions = 0
+        self.upstream_bytes = 0
+
+    async def start(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._load)
+
+    def _load(self):
+        """Index the files already on disk, least recently modified first"""
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                if entry.name.endswith(".part"):
+                    if time.time() - stat.st_mtime > STALE_PART_SECONDS:
+                        os.remove(entry.path)
+                    continue
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._files[name.split(".", 1)[0]] = (name, size)
+            self.bytes += size
+        logger.info(f"Audio cache has {len(self._files)} files ({self.bytes} bytes)")
+
+    async def stop(self):
+        tasks = [fill.task for fill in self._fills.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def open(self, id: str):
+        """CachedAudio or AudioFill for a track; raises LookupError if the
+        track has no download link, or the upstream error"""
+        digest = hashlib.sha1(id.encode("utf-8")).hexdigest()
+        cached = self._cached(digest)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        fill = self._fills.get(digest)
+        if fill is not None:
+            self.joined += 1
+        else:
+            self.misses += 1
+            fill = self._start_fill(id, digest)
+        await fill.ready.wait()
+        if fill.error is not None:
+            raise fill.error
+        return fill
+
+    def _cached(self, digest: str) -> Optional[CachedAudio]:
+        if digest not in self._files:
+            # Downloaded by another worker sharing the directory
+            for path in glob.glob(os.path.join(self.directory, f"{digest}.*")):
+                if not path.endswith(".part"):
+                    self._add(digest, os.path.basename(path), os.path.getsize(path))
+                    break
+            else:
+                return None
+        name, size = self._files[digest]
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            # Evicted by another worker sharing the directory
+            del self._files[digest]
+            self.bytes -= size
+            return None
+        self._files.move_to_end(digest)
+        content_type = mimetypes.guess_type(name)[0] or DEFAULT_CONTENT_TYPE
+        return CachedAudio(path, size, content_type)
+
+    def _start_fill(self, id: str, digest: str) -> AudioFill:
+        part = os.path.join(self.directory, f"{digest}.{os.getpid()}.part")
+        fill = AudioFill(id, part)
+        self._fills[digest] = fill
+        fill.task = asyncio.ensure_future(self._fill(fill, digest))
+        fill.task.add_done_callback(lambda _: self._fills.pop(digest, None))
+        return fill
+
+    async def _fill(self, fill: AudioFill, digest: str):
+        self.fills += 1
+        loop = asyncio.get_running_loop()
+        part = fill.path
+        try:
+            # A cached download link may have expired: retry with a new one
+            for refresh in (False, True):
+                link = await get_download_link(fill.id, refresh=refresh)
+                if not link:
+                    raise LookupError(f"No download link for track {fill.id}")
+                client = upstream.get_media_client()
+                async with client.stream("GET", link) as response:
+                    if response.status_code in EXPIRED_LINK_STATUSES and not refresh:
+                        continue
+                    response.raise_for_status()
+                    await self._download(fill, response, loop)
+                    break
+
+            if fill.size is not None and fill.written != fill.size:
+                raise IOError(f"Got {fill.written} of {fill.size} bytes")
+            extension = mimetypes.guess_extension(fill.content_type) or ".audio"
+            name = f"{digest}{extension}"
+            os.replace(part, os.path.join(self.directory, name))
+            fill.path = os.path.join(self.directory, name)
+            self._add(digest, name, fill.written)
+            await fill.advance(done=True)
+        except Exception as e:
+            self.fill_failures += 1
+            logger.error(f"Error caching audio for track {fill.id}: {e}")
+            await fill.advance(error=e)
+            if os.path.exists(part):
+                os.remove(part)
+        finally:
+            # Also wakes openers when the download failed before responding
+            fill.ready.set()
+
+    async def _download(self, fill: AudioFill, response, loop):
+        length = response.headers.get("content-length")
+        # A content-encoded length is not the length of the decoded audio
+        encoded = response.headers.get("content-encoding", "identity") != "identity"
+        fill.size = int(length) if length and not encoded else None
+        content_type = response.headers.get("content-type", "").split(";")[0]
+        if content_type.startswith("audio/"):
+            fill.content_type = content_type
+        with open(fill.path, "wb") as f:
+            fill.ready.set()
+            async for chunk in response.aiter_bytes(AUDIO_STREAM_CHUNK_BYTES):
+                await loop.run_in_executor(None, _write, f, chunk)
+                self.upstream_bytes += len(chunk)
+                await fill.advance(len(chunk))
+
+    def _add(self, digest: str, name: str, size: int):
+        previous = self._files.pop(digest, None)
+        if previous is not None:
+            # Filled again: the new file replaced the old one
+            self.bytes -= previous[1]
+            if previous[0] != name:
+                try:
+                    os.remove(os.path.join(self.directory, previous[0]))
+                except FileNotFoundError:
+                    pass
+        self._files[digest] = (name, size)
+        self.bytes += size
+        # Files being read stay readable after unlinking
+        while self.bytes > self.max_bytes and len(self._files) > 1:
+            evicted, (evicted_name, evicted_size) = self._files.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, evicted_name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "files": len(self._files),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "filling": len(self._fills),
+            "hits": self.hits,
+            "joined_fills": self.joined,
+            "misses": self.misses,
+            "fills": self.fills,
+            "fill_failures": self.fill_failures,
+            "evictions": self.evictions,
+            "upstream_bytes": self.upstream_bytes,
+        }
+
+
+audio_stream_cache = AudioStreamCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
@@ -0,0 +1,212 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from core.config import (
+    logger,
+    L1_CACHE_MAX_ENTRIES,
+    L1_CACHE_TTL_TRACK_INFO,
+    L1_CACHE_TTL_LYRICS,
+    L1_CACHE_TTL_DOWNLOAD,
+    L1_CACHE_TTL_QUERY,
+    L1_CACHE_TTL_DEFAULT,
+)
+from db.mongo import search_history_collection
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        deadline, value = entry
+        if deadline <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# Keys follow the search_history_collection "query" field
+_L1_TTL_BY_PREFIX = (
+    ("track_infor_", L1_CACHE_TTL_TRACK_INFO),
+    ("lyrics_", L1_CACHE_TTL_LYRICS),
+    ("download_", L1_CACHE_TTL_DOWNLOAD),
+    ("{", L1_CACHE_TTL_QUERY),  # JSON querystrings from search / top-200
+)
+
+l1_cache = TTLCache(L1_CACHE_MAX_ENTRIES)
+
+
+def _l1_ttl(query: str, expires_at: datetime) -> float:
+    """Per-key-type TTL, capped so an entry never outlives its Mongo copy"""
+    ttl = L1_CACHE_TTL_DEFAULT
+    for prefix, prefix_ttl in _L1_TTL_BY_PREFIX:
+        if query.startswith(prefix):
+            ttl = prefix_ttl
+            break
+    remaining = (expires_at - datetime.now()).total_seconds()
+    return min(ttl, remaining)
+
+
+async def get_cached_result(query: str) -> Optional[Any]:
+    """Look up a cached result in L1, falling back to search_history_collection"""
+    result = l1_cache.get(query)
+    if result is not None:
+        return result
+
+    cached = await search_history_collection.find_one(
+        {"query": query, "expires_at": {"$gt": datetime.now()}}
+    )
+    if not cached:
+        return None
+
+    l1_cache.set(query, cached["result"], _l1_ttl(query, cached["expires_at"]))
+    return cached["result"]
+
+
+async def get_cached_results(queries: List[str]) -> Dict[str, Any]:
+    """Batched get_cached_result: L1 first, then one $in query for the rest"""
+    results = {}
+    missing = []
+    for query in queries:
+        result = l1_cache.get(query)
+        if result is not None:
+            results[query] = result
+        else:
+            missing.append(query)
+
+    if missing:
+        cursor = search_history_collection.find(
+            {"query": {"$in": missing}, "expires_at": {"$gt": datetime.now()}},
+            {"query": 1, "result": 1, "expires_at": 1},
+        )
+        async for cached in cursor:
+            query = cached["query"]
+            results[query] = cached["result"]
+            l1_cache.set(query, cached["result"], _l1_ttl(query, cached["expires_at"]))
+
+    return results
+
+
+async def set_cached_result(query: str, result: Any, ttl: timedelta):
+    """Write a result to search_history_collection and L1 with the same expiry"""
+    expires_at = datetime.now() + ttl
+    await search_history_collection.update_one(
+        {"query": query},
+        {"$set": {"result": result, "expires_at": expires_at}},
+        upsert=True,
+    )
+    l1_cache.set(query, result, _l1_ttl(query, expires_at))
+    logger.debug(f"Cached {query} until {expires_at}")
+
+
+async def set_cached_results(results: Dict[str, Any], ttl: timedelta):
+    """Batched set_cached_result using a single unordered bulk write"""
+    if not results:
+        return
+    expires_at = datetime.now() + ttl
+    await search_history_collection.bulk_write(
+        [
+            UpdateOne(
+                {"query": query},
+                {"$set": {"result": result, "expires_at": expires_at}},
+                upsert=True,
+            )
+            for query, result in results.items()
+        ],
+        ordered=False,
+    )
+    for query, result in results.items():
+        l1_cache.set(query, result, _l1_ttl(query, expires_at))
+
+
+async def get_cached_entry(query: str) -> Optional[Dict[str, Any]]:
+    """Cached result with its created_at, fresh_until and expires_at.
+
+    Unlike get_cached_result, expired entries are returned too, so a caller
+    can still serve them when a refresh fails.
+    """
+    l1_key = f"entry:{query}"
+    entry = l1_cache.get(l1_key)
+    if entry is not None:
+        return entry
+
+    entry = await search_history_collection.find_one(
+        {"query": query},
+        {"_id": 0, "result": 1, "created_at": 1, "fresh_until": 1, "expires_at": 1},
+    )
+    if not entry or "result" not in entry:
+        return None
+    entry.setdefault("created_at", None)
+    entry.setdefault("fresh_until", entry.get("expires_at"))
+    l1_cache.set(l1_key, entry, _l1_ttl(query, entry["expires_at"]))
+    return entry
+
+
+async def set_cached_entry(
+    query: str, result: Any, fresh_ttl: timedelta, ttl: timedelta
+) -> Dict[str, Any]:
+    """set_cached_result that also records when the result turns stale"""
+    now = datetime.now()
+    entry = {
+        "result": result,
+        "created_at": now,
+        "fresh_until": now + fresh_ttl,
+        "expires_at": now + ttl,
+    }
+    await search_history_collection.update_one(
+        {"query": query}, {"$set": entry}, upsert=True
+    )
+    l1_cache.set(query, result, _l1_ttl(query, entry["expires_at"]))
+    l1_cache.set(f"entry:{query}", entry, _l1_ttl(query, entry["expires_at"]))
+    return entry
+
+
+def cache_stats() -> Dict[str, int]:
+    return l1_cache.stats()
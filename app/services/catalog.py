@@ -0,0 +1,39 @@
+import time
+
+from pymongo import ReturnDocument
+
+from core.config import CATALOG_GENERATION_TTL
+from db.mongo import counters_collection
+
+_GENERATION_ID = "catalog_generation"
+_generation = 0
+_checked_at = float("-inf")
+
+
+async def get_catalog_generation() -> int:
+    """Counter bumped whenever tracks are embedded or re-embedded.
+
+    Cache keys derived from the catalog include it, so entries computed
+    against an older catalog are never read again. Each worker re-reads the
+    counter at most every CATALOG_GENERATION_TTL seconds.
+    """
+    global _generation, _checked_at
+    if time.monotonic() - _checked_at < CATALOG_GENERATION_TTL:
+        return _generation
+    doc = await counters_collection.find_one({"_id": _GENERATION_ID})
+    _generation = doc["value"] if doc else 0
+    _checked_at = time.monotonic()
+    return _generation
+
+
+async def bump_catalog_generation() -> int:
+    global _generation, _checked_at
+    doc = await counters_collection.find_one_and_update(
+        {"_id": _GENERATION_ID},
+        {"$inc": {"value": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    _generation = doc["value"]
+    _checked_at = time.monotonic()
+    return _generation
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
+
+from core.config import logger, MOCKS_DIR, CHART_DATASETS_POLL_INTERVAL
+from models.tracks import (
+    Country,
+    PopularAlbum,
+    PopularArtist,
+    PopularSong,
+    PopularSongsResponse,
+)
+from services.song_resolver import fold_text, normalize_artists
+
+# popular_vn_songs.json, popular_vn_album.json, porpular_kr_songs.json, ...
+_FILE_PATTERN = re.compile(
+    r"^po(?:r)?pular_(?P<region>[a-z]+)_(?P<kind>songs|album|artist)\.json$"
+)
+_MODELS = {"songs": PopularSong, "album": PopularAlbum, "artist": PopularArtist}
+# Chart region of each country; regions without a dataset fall back to global
+_REGIONS = {
+    Country.GLOBAL: "global",
+    Country.USUK: "usuk",
+    Country.KR: "kr",
+    Country.VN: "vn",
+}
+
+
+class ChartDataset:
+    """One validated chart file, with songs indexed by genre, artist and year"""
+
+    def __init__(self, path: str, kind: str, mtime: float, records: Sequence):
+        self.path = path
+        self.kind = kind
+        self.mtime = mtime
+        self.records = tuple(records)
+        self.by_genre: Dict[str, List[int]] = defaultdict(list)
+        self.by_artist: Dict[str, List[int]] = defaultdict(list)
+        self.by_year: Dict[str, List[int]] = defaultdict(list)
+        self.response: Optional[PopularSongsResponse] = None
+        if kind == "songs":
+            for position, song in enumerate(self.records):
+                self.by_genre[fold_text(song.genre)].append(position)
+                for artist in normalize_artists(song.artist):
+                    self.by_artist[artist].append(position)
+                self.by_year[song.year].append(position)
+            self.response = PopularSongsResponse(data=list(self.records))
+
+    def select(
+        self,
+        genre: Optional[str] = None,
+        artist: Optional[str] = None,
+        year: Optional[str] = None,
+    ) -> List:
+        """Records matching every given filter, in chart order"""
+        positions = None
+        for index, value in (
+            (self.by_genre, genre and fold_text(genre)),
+            (self.by_artist, artist and (normalize_artists(artist) or [None])[0]),
+            (self.by_year, year),
+        ):
+            if not value:
+                continue
+            matches = set(index.get(value, ()))
+            positions = matches if positions is None else positions & matches
+        if positions is None:
+            return list(self.records)
+        return [self.records[position] for position in sorted(positions)]
+
+
+class ChartDatasetRegistry:
+    """Chart files from MOCKS_DIR, parsed and validated once.
+
+    Every file is loaded at startup; afterwards a background task re-checks
+    the files' mtimes every poll interval and reloads only changed ones, so
+    requests never read or parse a file. A file that fails to load keeps
+    its previous version.
+    """
+
+    def __init__(self, directory: str, poll_interval: int):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._datasets: Dict[Tuple[str, str], ChartDataset] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.load_errors = 0
+        self.refreshed_at: Optional[datetime] = None
+
+    async def start(self):
+        self.refresh()
+        self._task = asyncio.ensure_future(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await loop.run_in_executor(None, self.refresh)
+            except Exception as e:
+                logger.error(f"Error refreshing chart datasets: {e}")
+
+    def refresh(self) -> int:
+        """Load new or changed files and drop removed ones; returns how many
+        files were loaded"""
+        datasets = {}
+        loaded = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                match = _FILE_PATTERN.match(entry.name)
+                if match is None:
+                    continue
+                key = (match["region"], match["kind"])
+                mtime = entry.stat().st_mtime
+                current = self._datasets.get(key)
+                if current is not None and current.mtime == mtime:
+                    datasets[key] = current
+                    continue
+                dataset = self._load(entry.path, match["kind"], mtime)
+                if dataset is not None:
+                    datasets[key] = dataset
+                    loaded += 1
+                elif current is not None:
+                    datasets[key] = current
+        # Swapped in whole, so readers never see a partly refreshed registry
+        self._datasets = datasets
+        self.refreshed_at = datetime.now()
+        return loaded
+
+    def _load(self, path: str, kind: str, mtime: float) -> Optional[ChartDataset]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            model = _MODELS[kind]
+            records = [model(**record) for record in data]
+        except (OSError, ValueError, TypeError, ValidationError) as e:
+            self.load_errors += 1
+            logger.error(f"Error loading chart dataset {path}: {e}")
+            return None
+        self.loads += 1
+        logger.info(f"Loaded {len(records)} {kind} records from {path}")
+        return ChartDataset(path, kind, mtime, records)
+
+    def dataset(self, country: Country, kind: str) -> Optional[ChartDataset]:
+        """The country's dataset of a kind, else the global one"""
+        if self.refreshed_at is None:
+            # Used outside the app (scripts) without start()
+            self.refresh()
+        region = _REGIONS.get(country, "global")
+        return self._datasets.get((region, kind)) or self._datasets.get(
+            ("global", kind)
+        )
+
+    def songs_response(self, country: Country) -> Optional[PopularSongsResponse]:
+        dataset = self.dataset(country, "songs")
+        return dataset.response if dataset else None
+
+    def songs(
+        self,
+        country: Country,
+        genre: Optional[str] = None,
+        artist: Optional[str] = None,
+        year: Optional[str] = None,
+    ) -> Optional[List[PopularSong]]:
+        dataset = self.dataset(country, "songs")
+        return dataset.select(genre, artist, year) if dataset else None
+
+    def albums(self, country: Country) -> Optional[List[PopularAlbum]]:
+        dataset = self.dataset(country, "album")
+        return list(dataset.records) if dataset else None
+
+    def artists(self, country: Country) -> Optional[List[PopularArtist]]:
+        dataset = self.dataset(country, "artist")
+        return list(dataset.records) if dataset else None
+
+    def stats(self) -> Dict:
+        return {
+            "datasets": {
+                f"{region}_{kind}": len(dataset.records)
+                for (region, kind), dataset in self._datasets.items()
+            },
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "refreshed_at": self.refreshed_at,
+        }
+
+
+chart_datasets = ChartDatasetRegistry(MOCKS_DIR, CHART_DATASETS_POLL_INTERVAL)
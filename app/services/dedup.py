@@ -0,0 +1,156 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+from pymongo import UpdateOne
+
+from core.config import (
+    logger,
+    DEDUP_LSH_BANDS,
+    DEDUP_MAX_HAMMING,
+    DEDUP_MAX_DURATION_DIFF_MS,
+)
+from db.mongo import tracks_collection
+from services.audio_features import audio_pipeline
+from services.catalog import bump_catalog_generation
+
+
+def is_duplicate(doc: Dict) -> bool:
+    """True for a track whose canonical_id points at another track"""
+    return doc.get("canonical_id", doc["_id"]) != doc["_id"]
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent: Dict[str, str] = {}
+
+    def find(self, item: str) -> str:
+        self.parent.setdefault(item, item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a: str, b: str):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+def find_duplicate_clusters(
+    fingerprints: Dict[str, bytes],
+    durations: Dict[str, int],
+    bands: int = DEDUP_LSH_BANDS,
+    max_hamming: int = DEDUP_MAX_HAMMING,
+    max_duration_diff: int = DEDUP_MAX_DURATION_DIFF_MS,
+) -> List[List[str]]:
+    """Clusters (of two or more ids) of near-identical chroma fingerprints.
+
+    Bit-sampling LSH: the fingerprint bits are split into bands, and tracks
+    sharing any band exactly become candidate pairs. With more bands than
+    max_hamming, two fingerprints within max_hamming bits of each other
+    share at least one band (pigeonhole), so no such pair is missed; fewer
+    bands trade that guarantee for fewer candidates. Candidates are kept if
+    their Hamming distance is small and both durations are known and agree,
+    and they are merged with union-find. Merging drops a track from the
+    similarity index, so a fingerprint match alone is never enough.
+    """
+    ids = list(fingerprints)
+    if len(ids) < 2:
+        return []
+    packed = np.stack([np.frombuffer(fingerprints[id], dtype=np.uint8) for id in ids])
+    bits = np.unpackbits(packed, axis=1)
+    if bands <= max_hamming:
+        logger.warning(
+            f"{bands} LSH bands can miss duplicates within {max_hamming} bits"
+        )
+
+    candidates = set()
+    bands = min(bands, bits.shape[1])
+    for band in np.array_split(np.arange(bits.shape[1]), bands):
+        buckets = defaultdict(list)
+        for row, key in enumerate(np.packbits(bits[:, band], axis=1)):
+            buckets[key.tobytes()].append(row)
+        for rows in buckets.values():
+            for i, a in enumerate(rows):
+                for b in rows[i + 1 :]:
+                    candidates.add((a, b))
+
+    clusters = UnionFind()
+    for a, b in candidates:
+        if int(np.count_nonzero(bits[a] != bits[b])) > max_hamming:
+            continue
+        duration_a, duration_b = durations.get(ids[a]), durations.get(ids[b])
+        if (
+            not duration_a
+            or not duration_b
+            or abs(duration_a - duration_b) > max_duration_diff
+        ):
+            continue
+        clusters.union(ids[a], ids[b])
+
+    members = defaultdict(list)
+    for id in clusters.parent:
+        members[clusters.find(id)].append(id)
+    return [ids for ids in members.values() if len(ids) > 1]
+
+
+async def deduplicate_tracks(audio_paths: Dict[str, str]) -> Dict[str, int]:
+    """Fingerprint {track_id: audio_path} and record canonical_id on tracks.
+
+    The canonical track of a cluster is the one stored first (then lowest
+    id); every fingerprinted track gets a canonical_id, its own if unique.
+    Changed tracks get a new updated_at so the vector index re-syncs them.
+    """
+    fingerprints = await audio_pipeline.chroma_fingerprints(audio_paths)
+    docs = {
+        doc["_id"]: doc
+        async for doc in tracks_collection.find(
+            {"_id": {"$in": list(fingerprints)}},
+            {"duration": 1, "created_at": 1},
+        )
+    }
+    # Only tracks in the catalog take part
+    fingerprints = {id: fp for id, fp in fingerprints.items() if id in docs}
+    durations = {
+        id: (doc.get("duration") or {}).get("totalMilliseconds")
+        for id, doc in docs.items()
+    }
+    clusters = find_duplicate_clusters(fingerprints, durations)
+
+    canonical = {id: id for id in fingerprints}
+    for cluster in clusters:
+        first = min(
+            cluster, key=lambda id: (docs[id].get("created_at") or datetime.max, id)
+        )
+        for id in cluster:
+            canonical[id] = first
+
+    now = datetime.now()
+    operations = [
+        UpdateOne(
+            {"_id": id, "canonical_id": {"$ne": canonical_id}},
+            {"$set": {"canonical_id": canonical_id, "updated_at": now}},
+        )
+        for id, canonical_id in canonical.items()
+    ]
+    changed = 0
+    if operations:
+        result = await tracks_collection.bulk_write(operations, ordered=False)
+        changed = result.modified_count
+    if changed:
+        await bump_catalog_generation()
+
+    stats = {
+        "tracks": len(audio_paths),
+        "fingerprinted": len(fingerprints),
+        "clusters": len(clusters),
+        "duplicates": sum(len(cluster) - 1 for cluster in clusters),
+        "changed": changed,
+    }
+    logger.info(f"Track de-duplication: {stats}")
+    return stats
@@ -0,0 +1,54 @@
+import struct
+from typing import Any, List
+
+import numpy as np
+from bson.binary import Binary, USER_DEFINED_SUBTYPE
+
+from core.config import EMBEDDING_STORAGE_FORMAT
+
+# Header: magic, dtype code, format version, dimension (8 bytes keeps the
+# payload aligned for np.frombuffer)
+_HEADER = struct.Struct("<4sBBH")
+_MAGIC = b"EMBV"
+_VERSION = 1
+_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+_CODES = {"float32": 1, "float16": 2}
+
+STORAGE_FORMATS = ("array", "float32", "float16")
+
+
+def encode_embedding(vector, storage_format: str = EMBEDDING_STORAGE_FORMAT) -> Any:
+    """Encode a vector for tracks_collection in the configured storage format"""
+    if storage_format == "array":
+        return np.asarray(vector, dtype=np.float64).tolist()
+    code = _CODES[storage_format]
+    values = np.asarray(vector, dtype=_DTYPES[code])
+    header = _HEADER.pack(_MAGIC, code, _VERSION, len(values))
+    return Binary(header + values.tobytes(), USER_DEFINED_SUBTYPE)
+
+
+def decode_embedding(value) -> np.ndarray:
+    """Decode a stored embedding in either format.
+
+    Binary embeddings are returned as a read-only zero-copy view in their
+    stored dtype (float32 or float16); BSON arrays become float32.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        magic, code, _, dim = _HEADER.unpack_from(value)
+        if magic != _MAGIC or code not in _DTYPES:
+            raise ValueError("Unknown binary embedding format")
+        return np.frombuffer(value, dtype=_DTYPES[code], count=dim, offset=_HEADER.size)
+    return np.asarray(value, dtype=np.float32)
+
+
+def embedding_format(value) -> str:
+    """Storage format of a stored embedding"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        _, code, _, _ = _HEADER.unpack_from(value)
+        return {v: k for k, v in _CODES.items()}[code]
+    return "array"
+
+
+def embedding_to_list(value) -> List[float]:
+    """Stored embedding as a list of floats, e.g. for an Atlas queryVector"""
+    return decode_embedding(value).astype(np.float64).tolist()
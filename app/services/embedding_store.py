@@ -0,0 +1,379 @@
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import logger
+
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingStore:
+    """Pre-normalized float32 embeddings in one memory-mapped matrix.
+
+    Rows live in an append-only file so every uvicorn worker on the host maps
+    the same pages. Alongside it are an append-only id file (row i holds the
+    id on line i) and a tombstone file of dead rows. Re-embedding a track
+    tombstones its old row and appends a new one. Writers serialize on a
+    lock file, and readers pick up rows appended by other workers in
+    refresh(). compact() rewrites the live rows into a new generation.
+
+    Vectors are appended before their ids, so a reader never maps an id
+    without its row. A writer that dies between the two appends leaves rows
+    without ids; they are cut off, along with any partial line, under the
+    lock before the next append and when the store is opened.
+    """
+
+    def __init__(self, directory: str, model: str):
+        self.directory = directory
+        self.model = model
+        self.dim: Optional[int] = None
+        self.generation = 0
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self._ids_offset = 0
+        self._tombstones_offset = 0
+
+    # File layout -----------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _gen_path(self, name: str, generation: Optional[int] = None) -> str:
+        generation = self.generation if generation is None else generation
+        return self._path(f"{name}.{generation}")
+
+    @contextmanager
+    def _lock(self):
+        with open(self._path("store.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Dict:
+        try:
+            with open(self._path("meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_meta(self, generation: int, dim: Optional[int]):
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"generation": generation, "dim": dim, "model": self.model}, f)
+        os.replace(tmp_path, self._path("meta.json"))
+
+    # Reading ---------------------------------------------------------------
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock():
+            meta = self._read_meta()
+            if meta.get("model") != self.model:
+                # Different embedding space: start a fresh, empty generation
+                generation = meta.get("generation", -1) + 1
+                self._write_meta(generation, None)
+                logger.info(f"Starting embedding store generation {generation}")
+            self._reset()
+            self._repair()
+            self.refresh()
+
+    def _repair(self):
+        """Cut the files back to the complete rows both id and vector file hold"""
+        data = self._read_file("ids")
+        ids_bytes = data.rfind(b"\n") + 1
+        rows = data.count(b"\n", 0, ids_bytes)
+        if self.dim and os.path.exists(self._gen_path("vectors")):
+            vector_rows = os.path.getsize(self._gen_path("vectors")) // (4 * self.dim)
+            if vector_rows < rows:
+                logger.warning(f"Embedding store has {rows} ids for {vector_rows} rows")
+                ids_bytes = 0
+                for _ in range(vector_rows):
+                    ids_bytes = data.index(b"\n", ids_bytes) + 1
+                rows = vector_rows
+        tombstones_bytes = self._read_file("tombstones").rfind(b"\n") + 1
+        self._truncate_torn(rows, ids_bytes, tombstones_bytes)
+
+    def _read_file(self, name: str) -> bytes:
+        try:
+            with open(self._gen_path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return b""
+
+    def _truncate_torn(self, rows: int, ids_bytes: int, tombstones_bytes: int):
+        """Drop bytes past the last complete row; the store lock must be held"""
+        sizes = {
+            "ids": ids_bytes,
+            "vectors": rows * 4 * (self.dim or 0),
+            "tombstones": tombstones_bytes,
+        }
+        for name, size in sizes.items():
+            path = self._gen_path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                logger.warning(f"Truncating torn append to {path}")
+                os.truncate(path, size)
+
+    def _reset(self):
+        meta = self._read_meta()
+        self.generation = meta.get("generation", 0)
+        self.dim = meta.get("dim")
+        self.matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.ids = []
+        self.rows = {}
+        self._ids_offset = 0
+        self._tombstones_offset = 0
+
+    def refresh(self) -> bool:
+        """Pick up rows and tombstones written by any worker; True if changed"""
+        meta = self._read_meta()
+        if meta.get("generation", 0) != self.generation:
+            self._reset()
+        elif self.dim is None and meta.get("dim"):
+            self.dim = meta["dim"]
+
+        changed = False
+        new_ids = self._read_lines("ids", "_ids_offset")
+        if new_ids:
+            start = len(self.ids)
+            self.ids.extend(new_ids)
+            self.alive = np.concatenate([self.alive, np.ones(len(new_ids), bool)])
+            for row, id in enumerate(new_ids, start):
+                old_row = self.rows.get(id)
+                if old_row is not None:
+                    self.alive[old_row] = False
+                self.rows[id] = row
+            self.matrix = np.memmap(
+                self._gen_path("vectors"),
+                dtype=np.float32,
+                mode="r",
+                shape=(len(self.ids), self.dim),
+            )
+            changed = True
+
+        for line in self._read_lines("tombstones", "_tombstones_offset"):
+            row = int(line)
+            if row < len(self.alive):
+                self.alive[row] = False
+            changed = True
+        return changed
+
+    def _read_lines(self, name: str, offset_attr: str) -> List[str]:
+        path = self._gen_path(name)
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb") as f:
+            f.seek(getattr(self, offset_attr))
+            data = f.read()
+        # Only consume complete lines; a writer may be mid-append
+        end = data.rfind(b"\n") + 1
+        setattr(self, offset_attr, getattr(self, offset_attr) + end)
+        return [line for line in data[:end].decode("utf-8").split("\n") if line]
+
+    def __len__(self) -> int:
+        return int(self.alive.sum())
+
+    def vector(self, id: str) -> Optional[np.ndarray]:
+        row = self.rows.get(id)
+        if row is None or not self.alive[row]:
+            return None
+        return np.asarray(self.matrix[row])
+
+    # Writing ---------------------------------------------------------------
+
+    def upsert_many(self, items: Iterable[Tuple[str, Iterable[float]]]) -> List[int]:
+        """Append new or changed vectors; returns the row of each item.
+
+        Items whose stored vector is already identical keep their row, so
+        workers syncing the same tracks from Mongo do not duplicate rows.
+        """
+        items = list(items)
+        if not items:
+            return []
+        with self._lock():
+            self.refresh()
+            if self.dim is None:
+                self.dim = len(items[0][1])
+                self._write_meta(self.generation, self.dim)
+                self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+
+            rows: List[int] = []
+            appended: Dict[str, int] = {}
+            appended_ids = []
+            vectors = []
+            tombstones = []
+            next_row = len(self.ids)
+            for id, vector in items:
+                vector = normalize_vectors(np.asarray(vector, dtype=np.float32))
+                if len(vector) != self.dim:
+                    rows.append(-1)
+                    continue
+                row = appended.get(id, self.rows.get(id))
+                if row is not None and row < len(self.alive) and self.alive[row]:
+                    if np.allclose(self.matrix[row], vector, atol=1e-6):
+                        rows.append(row)
+                        continue
+                if row is not None:
+                    tombstones.append(row)
+                appended[id] = next_row
+                appended_ids.append(id)
+                vectors.append(vector)
+                rows.append(next_row)
+                next_row += 1
+
+            if vectors or tombstones:
+                self._truncate_torn(
+                    len(self.ids), self._ids_offset, self._tombstones_offset
+                )
+            if vectors:
+                # Vectors first, then ids: a reader never sees an id without its row
+                with open(self._gen_path("vectors"), "ab") as f:
+                    f.write(np.stack(vectors).astype(np.float32).tobytes())
+                with open(self._gen_path("ids"), "ab") as f:
+                    f.write("".join(f"{id}\n" for id in appended_ids).encode("utf-8"))
+            if tombstones:
+                self._append_tombstones(tombstones)
+            self.refresh()
+        # An id repeated within the batch resolves to its last row
+        return [
+            appended.get(id, row) if row != -1 else -1
+            for (id, _), row in zip(items, rows)
+        ]
+
+    def remove_many(self, ids: Iterable[str]):
+        with self._lock():
+            self.refresh()
+            rows = [self.rows[id] for id in ids if id in self.rows]
+            if rows:
+                self._truncate_torn(
+                    len(self.ids), self._ids_offset, self._tombstones_offset
+                )
+                self._append_tombstones(rows)
+                self.refresh()
+
+    def _append_tombstones(self, rows: List[int]):
+        with open(self._gen_path("tombstones"), "ab") as f:
+            f.write("".join(f"{row}\n" for row in rows).encode("utf-8"))
+
+    def tombstoned_ratio(self) -> float:
+        if not self.ids:
+            return 0.0
+        return 1.0 - len(self) / len(self.ids)
+
+    def compact(self):
+        """Rewrite live rows into a new generation and drop the old files"""
+        with self._lock():
+            self.refresh()
+            old_generation = self.generation
+            generation = old_generation + 1
+            live = np.flatnonzero(self.alive)
+            with open(self._gen_path("vectors", generation), "wb") as f:
+                for start in range(0, len(live), 8192):
+                    f.write(
+                        np.asarray(self.matrix[live[start : start + 8192]]).tobytes()
+                    )
+            with open(self._gen_path("ids", generation), "wb") as f:
+                f.write("".join(f"{self.ids[row]}\n" for row in live).encode("utf-8"))
+            self._write_meta(generation, self.dim)
+            self._reset()
+            self.refresh()
+            for name in ("vectors", "ids", "tombstones"):
+                try:
+                    os.remove(self._gen_path(name, old_generation))
+                except FileNotFoundError:
+                    pass
+        logger.info(f"Compacted embedding store to {len(self)} rows")
+
+    # Search ----------------------------------------------------------------
+
+    def search(
+        self,
+        query,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[Tuple[str, float]]:
+        """Exact top-k by cosine similarity: one matrix-vector product plus
+        argpartition, over all rows or only the given candidate rows"""
+        if self.dim is None or not self.ids:
+            return []
+        query = normalize_vectors(np.asarray(query, dtype=np.float32))
+        if len(query) != self.dim:
+            return []
+
+        allowed = self.alive if mask is None else self.alive & mask[: len(self.alive)]
+        if rows is None:
+            scores = np.asarray(self.matrix @ query)
+            scores[~allowed] = -np.inf
+            candidates = np.arange(len(scores))
+        else:
+            rows = rows[allowed[rows]]
+            scores = np.asarray(self.matrix[rows] @ query)
+            candidates = rows
+
+        valid = int(np.isfinite(scores).sum())
+        k = min(k, valid)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[candidates[i]], float(scores[i])) for i in top]
+
+    def search_many(
+        self, queries, k: int, mask: Optional[np.ndarray] = None, chunk: int = 65536
+    ) -> List[List[Tuple[str, float]]]:
+        """Exact top-k for several queries at once: one matrix product per
+        chunk of rows, keeping a running top-k per query"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.dim is None or not self.ids or queries.shape[1] != self.dim:
+            return [[] for _ in queries]
+        queries = normalize_vectors(queries)
+
+        allowed = self.alive if mask is None else self.alive & mask[: len(self.alive)]
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(allowed), chunk):
+            rows = start + np.flatnonzero(allowed[start : start + chunk])
+            if not len(rows):
+                continue
+            scores = np.concatenate(
+                [best_scores, queries @ np.asarray(self.matrix[rows]).T], axis=1
+            )
+            candidates = np.concatenate(
+                [best_rows, np.broadcast_to(rows, (len(queries), len(rows)))], axis=1
+            )
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                candidates = np.take_along_axis(candidates, top, axis=1)
+            best_scores, best_rows = scores, candidates
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [
+            [(self.ids[row], float(score)) for row, score in zip(rows, scores)]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
+
+    def stats(self) -> Dict:
+        return {
+            "rows": len(self.ids),
+            "live": len(self),
+            "dim": self.dim,
+            "generation": self.generation,
+            "tombstoned_ratio": round(self.tombstoned_ratio(), 4),
+            "mapped_bytes": int(self.matrix.nbytes),
+        }
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from app.utils import (
+    create_hybrid_embeddings,
+    create_metadata_text,
+    embedding_text_hash,
+)
+from core.config import (
+    logger,
+    INGEST_QUEUE_MAXSIZE,
+    INGEST_BATCH_SIZE,
+    INGEST_BATCH_WAIT,
+    INGEST_WORKERS,
+    INGEST_SHUTDOWN_TIMEOUT,
+    EMBEDDING_MODEL_TAG,
+)
+from db.mongo import tracks_collection
+from services.catalog import bump_catalog_generation
+from services.embedding_codec import encode_embedding
+from services.song_resolver import track_search_fields
+from services.vector_index import vector_index
+from models.tracks import Track, TrackItem
+
+
+def _metadata_hash(track_data: dict) -> str:
+    payload = json.dumps(track_data, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingIngestQueue:
+    """Queue of tracks waiting to be embedded and written to tracks_collection.
+
+    Requests enqueue tracks without waiting; worker tasks drain the queue in
+    micro-batches and run the model in a thread pool so inference never runs
+    on the event loop.
+    """
+
+    def __init__(self, maxsize: int, batch_size: int, batch_wait: float, workers: int):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.processed = 0
+        self.written = 0
+        self.unchanged = 0
+        self.reused_embeddings = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.last_batch_seconds = 0.0
+
+    def submit(self, items: List[TrackItem]) -> int:
+        """Queue tracks for embedding; returns how many were accepted"""
+        if self._queue is None:
+            self.dropped += len(items or [])
+            return 0
+        accepted = 0
+        for item in items or []:
+            if not item.data or not item.data.id:
+                continue
+            try:
+                self._queue.put_nowait(item.data)
+                accepted += 1
+            except asyncio.QueueFull:
+                # Backpressure: drop rather than hold up the request, the
+                # track is queued again the next time a search returns it
+                self.dropped += 1
+        self.enqueued += accepted
+        return accepted
+
+    async def start(self):
+        # Queues are created here so they bind to the server's event loop
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="embedding-ingest"
+        )
+        self._tasks = [
+            asyncio.ensure_future(self._worker()) for _ in range(self.workers)
+        ]
+        logger.info(f"Embedding ingest started with {self.workers} worker(s)")
+
+    async def stop(self, timeout: float = INGEST_SHUTDOWN_TIMEOUT):
+        """Flush whatever is queued (up to timeout) and stop the workers"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Embedding ingest shutdown timed out with "
+                f"{self._queue.qsize()} tracks still queued"
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=True)
+        self._queue = None
+
+    async def _next_batch(self) -> List[Track]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            started = time.perf_counter()
+            try:
+                await self._store_batch(batch)
+                self.batches += 1
+            except Exception as e:
+                self.failed_batches += 1
+                logger.error(f"Error storing embedding batch: {e}")
+            finally:
+                self.processed += len(batch)
+                self.last_batch_seconds = time.perf_counter() - started
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _store_batch(self, batch: List[Track]):
+        """Embed new or changed tracks in one forward pass and bulk upsert them.
+
+        A track is re-embedded only when the hash of its embedding input text
+        or the model tag differs from what is stored with it, so metadata-only
+        changes and model upgrades are told apart.
+        """
+        tracks: Dict[str, tuple] = {}
+        for track in batch:
+            try:
+                text = create_metadata_text(track)
+            except (AttributeError, IndexError, TypeError):
+                logger.warning(f"Skipping track {track.id} with incomplete metadata")
+                continue
+            track_data = track.dict(exclude_none=True)
+            # Part of the hash, so tracks stored before get them on next sight
+            track_data.update(track_search_fields(track))
+            track_data["metadata_hash"] = _metadata_hash(track_data)
+            track_data["embedding_text_hash"] = embedding_text_hash(text)
+            track_data["embedding_model"] = EMBEDDING_MODEL_TAG
+            tracks[track.id] = (track, track_data)
+        if not tracks:
+            return
+
+        cursor = tracks_collection.find(
+            {"_id": {"$in": list(tracks)}, "embedding": {"$exists": True}},
+            {
+                "metadata_hash": 1,
+                "embedding_text_hash": 1,
+                "embedding_model": 1,
+                "canonical_id": 1,
+            },
+        )
+        stored = {doc["_id"]: doc async for doc in cursor}
+
+        to_embed = []
+        to_update = []
+        for id, (track, track_data) in tracks.items():
+            doc = stored.get(id) or {}
+            same_embedding = (
+                doc.get("embedding_model") == EMBEDDING_MODEL_TAG
+                and doc.get("embedding_text_hash") == track_data["embedding_text_hash"]
+            )
+            if not same_embedding:
+                to_embed.append((track, track_data))
+            elif doc.get("metadata_hash") != track_data["metadata_hash"]:
+                to_update.append((track, track_data))
+        self.unchanged += len(tracks) - len(to_embed) - len(to_update)
+        self.reused_embeddings += len(to_update)
+        if not to_embed and not to_update:
+            return
+
+        if to_embed:
+            loop = asyncio.get_running_loop()
+            embeddings = await loop.run_in_executor(
+                self._executor,
+                create_hybrid_embeddings,
+                [track for track, _ in to_embed],
+            )
+            for (_, track_data), embedding in zip(to_embed, embeddings):
+                track_data["embedding"] = encode_embedding(embedding)
+
+        now = datetime.now()
+        operations = []
+        for track, track_data in to_embed + to_update:
+            track_data["updated_at"] = now
+            operations.append(
+                UpdateOne(
+                    {"_id": track.id},
+                    {"$set": track_data, "$setOnInsert": {"created_at": now}},
+                    upsert=True,
+                )
+            )
+        await tracks_collection.bulk_write(operations, ordered=False)
+        self.written += len(operations)
+        if to_embed:
+            await vector_index.upsert_many(
+                [
+                    {
+                        "_id": track.id,
+                        **track_data,
+                        # Keeps duplicates out of the index when re-embedded
+                        "canonical_id": stored.get(track.id, {}).get(
+                            "canonical_id", track.id
+                        ),
+                    }
+                    for track, track_data in to_embed
+                ]
+            )
+            # New vectors change similarity results: retire cached ones
+            await bump_catalog_generation()
+        logger.info(f"Stored {len(operations)} tracks ({len(to_embed)} re-embedded)")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "maxsize": self.maxsize,
+            "workers": self.workers,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "written": self.written,
+            "unchanged": self.unchanged,
+            "reused_embeddings": self.reused_embeddings,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "last_batch_seconds": round(self.last_batch_seconds, 4),
+        }
+
+
+ingest_queue = EmbeddingIngestQueue(
+    maxsize=INGEST_QUEUE_MAXSIZE,
+    batch_size=INGEST_BATCH_SIZE,
+    batch_wait=INGEST_BATCH_WAIT,
+    workers=INGEST_WORKERS,
+)
@@ -0,0 +1,256 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from pymongo import UpdateOne, ReturnDocument
+
+from core.config import (
+    logger,
+    DOWNLOAD_LINK_REFRESH_INTERVAL,
+    DOWNLOAD_LINK_REFRESH_LEAD,
+    DOWNLOAD_LINK_REFRESH_CONCURRENCY,
+    DOWNLOAD_LINK_REFRESH_MAX_PER_ROUND,
+    DOWNLOAD_LINK_HOT_MIN_SCORE,
+    DOWNLOAD_LINK_HOT_HALF_LIFE,
+    DOWNLOAD_LINK_REFRESH_LOCK_LEASE,
+)
+from db.mongo import search_history_collection
+from services.locks import MongoLock
+
+
+def _cache_key(id: str) -> str:
+    return f"download_{id}"
+
+
+class DownloadLinkRefresher:
+    """Renews the download links of hot tracks before they expire.
+
+    Every link request counts towards an exponentially decayed access score
+    per track, kept on the track's download_{id} cache entry so that the
+    score covers requests served by every worker. Workers add up their
+    accesses in memory and merge them into Mongo once per round.
+
+    Each round, the worker holding the Mongo lease lock refreshes the links
+    of tracks scoring at least the hot threshold that expire within the
+    lead time, hottest first, at most max_per_round of them and
+    `concurrency` at a time. Cold tracks are left to expire. A worker that
+    finds the lock held only merges its accesses.
+
+    A refresh prevented a user-facing miss when the track is requested,
+    and served from cache, after the replaced link would have expired.
+    """
+
+    def __init__(
+        self,
+        interval: int,
+        lead: int,
+        concurrency: int,
+        max_per_round: int,
+        hot_min_score: float,
+        half_life: int,
+        lease: int,
+    ):
+        self.interval = interval
+        self.lead = timedelta(seconds=lead)
+        self.concurrency = concurrency
+        self.max_per_round = max_per_round
+        self.hot_min_score = hot_min_score
+        self.half_life = half_life
+        self.lock = MongoLock("download_link_refresh", timedelta(seconds=lease))
+        # Accesses since the last merge: count and time of the last cache hit
+        self._accesses: Dict[str, int] = {}
+        self._last_hits: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.rounds = 0
+        self.skipped_locked = 0
+        self.hot = 0
+        self.refreshed = 0
+        self.refresh_failures = 0
+        self.prevented_misses = 0
+        self.unused_refreshes = 0
+
+    async def start(self):
+        await search_history_collection.create_index("hot_until", sparse=True)
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Error saving download link accesses: {e}")
+        await self.lock.release()
+
+    def record_access(self, id: str, hit: bool):
+        """A request needed the track's link; hit if it came from cache"""
+        self._accesses[id] = self._accesses.get(id, 0) + 1
+        if hit:
+            self._last_hits[id] = datetime.now()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error refreshing download links: {e}")
+
+    async def flush(self):
+        """Merge the accesses recorded since the last flush into Mongo"""
+        accesses, self._accesses = self._accesses, {}
+        last_hits, self._last_hits = self._last_hits, {}
+        if not accesses:
+            return
+        now = datetime.now()
+        half_life_ms = self.half_life * 1000
+        age_ms = {"$subtract": [now, {"$ifNull": ["$hot_at", now]}]}
+        decayed = {
+            "$multiply": [
+                {"$ifNull": ["$hot_score", 0]},
+                {"$pow": [0.5, {"$divide": [age_ms, half_life_ms]}]},
+            ]
+        }
+        # Time until the score decays below the hot threshold
+        hot_for_ms = {
+            "$multiply": [
+                half_life_ms,
+                {"$log": [{"$divide": ["$hot_score", self.hot_min_score]}, 2]},
+            ]
+        }
+        await search_history_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"query": _cache_key(id)},
+                    [
+                        {"$set": {"hot_score": {"$add": [decayed, count]}}},
+                        {
+                            "$set": {
+                                "hot_at": now,
+                                "hot_until": {"$add": [now, hot_for_ms]},
+                            }
+                        },
+                    ],
+                    upsert=True,
+                )
+                for id, count in accesses.items()
+            ],
+            ordered=False,
+        )
+        if last_hits:
+            # A hit after the replaced link's expiry was a miss prevented
+            result = await search_history_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {
+                            "query": _cache_key(id),
+                            "refreshed_expiry": {"$lte": hit_at},
+                        },
+                        {"$unset": {"refreshed_expiry": ""}},
+                    )
+                    for id, hit_at in last_hits.items()
+                ],
+                ordered=False,
+            )
+            self.prevented_misses += result.modified_count
+
+    async def run_once(self) -> int:
+        """Refresh the hot links that are about to expire; returns how many"""
+        if not await self.lock.acquire():
+            self.skipped_locked += 1
+            return 0
+        try:
+            return await self._sweep()
+        finally:
+            await self.lock.release()
+
+    async def _sweep(self) -> int:
+        self.rounds += 1
+        hot = await self._load_hot()
+        self.hot = len(hot)
+
+        due_before = datetime.now() + self.lead
+        due = [
+            (score, id, expires_at)
+            for id, (score, expires_at) in hot.items()
+            if expires_at is not None and expires_at <= due_before
+        ]
+        due.sort(reverse=True)
+        due = due[: self.max_per_round]
+        if not due:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(self._refresh(id, expires_at, semaphore) for _, id, expires_at in due)
+        )
+        refreshed = sum(results)
+        logger.info(f"Refreshed {refreshed} of {len(due)} expiring download links")
+        return refreshed
+
+    async def _load_hot(self) -> Dict[str, Tuple[float, datetime]]:
+        """Score and link expiry of every track that is hot on any worker"""
+        now = datetime.now()
+        cursor = search_history_collection.find(
+            {"hot_until": {"$gt": now}},
+            {"query": 1, "hot_score": 1, "hot_at": 1, "expires_at": 1},
+        )
+        hot = {}
+        async for doc in cursor:
+            age = (now - doc["hot_at"]).total_seconds()
+            score = doc["hot_score"] * 0.5 ** (age / self.half_life)
+            if score >= self.hot_min_score:
+                id = doc["query"][len("download_") :]
+                hot[id] = (score, doc.get("expires_at"))
+        return hot
+
+    async def _refresh(
+        self, id: str, replaced_expiry: datetime, semaphore: asyncio.Semaphore
+    ) -> bool:
+        # Imported here: music_service reports accesses to this module
+        from services.music_service import get_download_link
+
+        async with semaphore:
+            try:
+                await get_download_link(id, refresh=True)
+            except Exception as e:
+                self.refresh_failures += 1
+                logger.warning(f"Error refreshing download link for {id}: {e}")
+                return False
+        self.refreshed += 1
+        previous = await search_history_collection.find_one_and_update(
+            {"query": _cache_key(id)},
+            {"$set": {"refreshed_expiry": replaced_expiry}},
+            {"refreshed_expiry": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous is not None and previous.get("refreshed_expiry") is not None:
+            # The previous refresh was never needed
+            self.unused_refreshes += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending_accesses": len(self._accesses),
+            "hot": self.hot,
+            "rounds": self.rounds,
+            "skipped_locked": self.skipped_locked,
+            "refreshed": self.refreshed,
+            "refresh_failures": self.refresh_failures,
+            "prevented_misses": self.prevented_misses,
+            "unused_refreshes": self.unused_refreshes,
+        }
+
+
+download_link_refresher = DownloadLinkRefresher(
+    interval=DOWNLOAD_LINK_REFRESH_INTERVAL,
+    lead=DOWNLOAD_LINK_REFRESH_LEAD,
+    concurrency=DOWNLOAD_LINK_REFRESH_CONCURRENCY,
+    max_per_round=DOWNLOAD_LINK_REFRESH_MAX_PER_ROUND,
+    hot_min_score=DOWNLOAD_LINK_HOT_MIN_SCORE,
+    half_life=DOWNLOAD_LINK_HOT_HALF_LIFE,
+    lease=DOWNLOAD_LINK_REFRESH_LOCK_LEASE,
+)
@@ -0,0 +1,40 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from db.mongo import locks_collection
+
+
+class MongoLock:
+    """Lease-based lock shared by every worker and replica through Mongo.
+
+    The lease expires on its own, so a worker that dies while holding it
+    only blocks the others until the lease runs out.
+    """
+
+    def __init__(self, name: str, lease: timedelta):
+        self.name = name
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def acquire(self) -> bool:
+        now = datetime.now()
+        try:
+            await locks_collection.update_one(
+                {
+                    "_id": self.name,
+                    "$or": [{"expires_at": {"$lt": now}}, {"owner": self.owner}],
+                },
+                {"$set": {"owner": self.owner, "expires_at": now + self.lease}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # Held by someone else: the filter missed and the upsert collided
+            return False
+
+    async def release(self):
+        await locks_collection.delete_one({"_id": self.name, "owner": self.owner})
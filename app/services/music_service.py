@@ -1,19 +1,31 @@
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 import http
 import numpy as np
-import requests
 import json
-from app.utils import create_hybrid_embedding
+from fastapi import Response
 from core.config import (
     RAPID_API_DOWNLOAD_HOST,
     logger,
-    RAPID_API_KEY,
     RAPID_API_HOST,
     RAPID_API_URL,
     CACHE_EXPIRE_TIME,
     RAPID_API_DOWNLOAD_URL,
+    DETAIL_PART_TIMEOUT,
+    TRACKS_UPSTREAM_BATCH_SIZE,
+    DETAIL_BATCH_CONCURRENCY,
+    SIMILAR_SONGS_CACHE_TTL,
+    TOP_TRACKS_FRESH_TTL,
+    POPULAR_SONGS_FRESH_TTL,
+    POPULAR_SONGS_TTL,
+    POPULAR_SONGS_PARTIAL_WAIT,
+    DOWNLOAD_LINK_TTL,
+    CHART_PUBLISH_WEEKDAY,
 )
 from models.tracks import (
+    PopularAlbum,
+    PopularArtist,
+    PopularSong,
     PopularSongsResponse,
     TrackList,
     TrackSearch,
@@ -25,7 +37,31 @@ from models.tracks import (
     Country,
     MusicTrack,
 )
-from db.mongo import search_history_collection, tracks_collection
+from db.mongo import tracks_collection
+from services.upstream import rapidapi_get
+from services.ingest import ingest_queue
+from services.catalog import get_catalog_generation
+from services.swr import CacheStatus, top_tracks_swr, popular_songs_swr
+from services.dedup import is_duplicate
+from services.song_resolver import song_resolver
+from services.chart_datasets import chart_datasets
+from services.link_refresher import download_link_refresher
+from services.embedding_codec import decode_embedding, embedding_to_list
+from services.vector_index import vector_index
+from services.embedding_store import normalize_vectors
+from services.cache import (
+    get_cached_entry,
+    get_cached_result,
+    get_cached_results,
+    set_cached_result,
+    set_cached_results,
+)
+from services.single_flight import (
+    search_flight,
+    track_info_flight,
+    download_flight,
+    lyrics_flight,
+)
 import asyncio
 import os
 
@@ -45,107 +81,93 @@ async def search_music_handler(data: TrackSearch):
         }
         querystring_json = json.dumps(querystring)
         logger.info(f"Searching for music: {querystring_json}")
-        search_history = await search_history_collection.find_one(
-            {"query": querystring_json, "expires_at": {"$gt": datetime.now()}}
-        )
+        search_history = await get_cached_result(querystring_json)
         if search_history:
             logger.info(f"Found search history for {query}")
-            result = TrackList(**search_history["result"])
+            result = TrackList(**search_history)
             return result
 
-        headers = {
-            "x-rapidapi-key": RAPID_API_KEY,
-            "x-rapidapi-host": RAPID_API_HOST,
-        }
-
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        list_of_tracks = response.json().get("tracks", [])
-        result = TrackList(
-            items=list_of_tracks,
-            totalCount=len(list_of_tracks),
-        )
+        async def fetch():
+            response_data = await rapidapi_get(url, RAPID_API_HOST, querystring)
+            list_of_tracks = response_data.get("tracks", [])
+            result = TrackList(
+                items=list_of_tracks,
+                totalCount=len(list_of_tracks),
+            )
 
-        search_history_collection.update_one(
-            {"query": querystring_json},
-            {
-                "$set": {
-                    "result": result.model_dump(),
-                    "expires_at": datetime.now() + timedelta(days=CACHE_EXPIRE_TIME),
-                }
-            },
-            upsert=True,
-        )
-        # Store the tracks in the database
-        logger.info(f"Storing {len(result.items)} tracks in the database")
-        for track in result.items:
-            track_data = track.data.dict(exclude_none=True)
-            track_data["created_at"] = datetime.now()
-            track_data["updated_at"] = datetime.now()
-            track_data["_id"] = track_data["id"]
-            embedding = create_hybrid_embedding(song_metadata=track.data)
-            track_data["embedding"] = embedding
-            tracks_collection.update_one(
-                {"_id": track_data["_id"]},
-                {"$set": track_data},
-                upsert=True,
+            await set_cached_result(
+                querystring_json,
+                result.model_dump(),
+                timedelta(days=CACHE_EXPIRE_TIME),
             )
-        return result
+            # Embedding and storing the tracks happens off the request path
+            accepted = ingest_queue.submit(result.items)
+            logger.info(f"Queued {accepted} tracks for embedding")
+            return result
+
+        # Concurrent misses for the same query share one upstream call
+        return await search_flight.do(querystring_json, fetch)
     except Exception as e:
         logger.error(f"Error searching music: {e}")
         raise e
 
 
-async def top_trending_tracks_handler(data: TopTrendingTracks):
-    try:
-        country = data.country
-        period = data.period
-        url = f"{RAPID_API_URL}/top_200_tracks"
-        querystring = {"country": country, "period": period}
-        if period == Period.weekly:
-            # Get latest Thursday
-            today = datetime.now()
-            thursday = today - timedelta(days=today.weekday())
-            date = thursday.strftime("%Y-%m-%d")
-            querystring["date"] = date
+def _top_trending_request(data: TopTrendingTracks):
+    """Cache key and upstream fetch for one top-200 chart"""
+    country = data.country
+    period = data.period
+    url = f"{RAPID_API_URL}/top_200_tracks"
+    querystring = {"country": country, "period": period}
+    if period == Period.weekly:
+        # Weekly charts are published on CHART_PUBLISH_WEEKDAY (Thursday)
+        today = datetime.now()
+        thursday = today - timedelta(days=(today.weekday() - CHART_PUBLISH_WEEKDAY) % 7)
+        date = thursday.strftime("%Y-%m-%d")
+        querystring["date"] = date
 
-        querystring_json = json.dumps(querystring)
-        logger.info(f"Getting top trending tracks: {querystring_json}")
-        search_history = await search_history_collection.find_one(
-            {"query": querystring_json, "expires_at": {"$gt": datetime.now()}}
-        )
-        if search_history:
-            logger.info(f"Found search history for {country} and {period}")
-            result = TrendingTracksResponse(**search_history["result"])
-            return result
+    async def fetch():
+        list_of_tracks = await rapidapi_get(url, RAPID_API_HOST, querystring)
+        return TrendingTracksResponse(tracks=list_of_tracks).model_dump()
 
-        headers = {
-            "x-rapidapi-key": RAPID_API_KEY,
-            "x-rapidapi-host": RAPID_API_HOST,
-        }
+    return json.dumps(querystring), fetch
 
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        list_of_tracks = response.json()
-        result = TrendingTracksResponse(
-            tracks=list_of_tracks,
-        )
-        await search_history_collection.update_one(
-            {"query": querystring_json},
-            {
-                "$set": {
-                    "result": result.model_dump(),
-                    "expires_at": datetime.now() + timedelta(days=CACHE_EXPIRE_TIME),
-                }
-            },
-            upsert=True,
+
+async def top_trending_tracks_handler(
+    data: TopTrendingTracks, response: Optional[Response] = None
+):
+    try:
+        querystring_json, fetch = _top_trending_request(data)
+        logger.info(f"Getting top trending tracks: {querystring_json}")
+
+        # Past the fresh TTL the cached chart is served while it refreshes
+        cached, status = await top_tracks_swr.get(
+            querystring_json,
+            fetch,
+            timedelta(seconds=TOP_TRACKS_FRESH_TTL),
+            timedelta(days=CACHE_EXPIRE_TIME),
         )
-        return result
+        status.apply(response)
+        return TrendingTracksResponse(**cached)
     except Exception as e:
         logger.error(f"Error getting top trending tracks: {e}")
         raise e
 
 
+async def warm_top_trending_tracks(
+    data: TopTrendingTracks, horizon: timedelta, force: bool = False
+) -> bool:
+    """Refresh a top-200 chart ahead of it turning stale"""
+    querystring_json, fetch = _top_trending_request(data)
+    return await top_tracks_swr.warm(
+        querystring_json,
+        fetch,
+        timedelta(seconds=TOP_TRACKS_FRESH_TTL),
+        timedelta(days=CACHE_EXPIRE_TIME),
+        horizon,
+        force=force,
+    )
+
+
 # Get music detail by id
 async def get_music_detail_by_id(id: str) -> MusicTrack:
     try:
@@ -154,49 +176,34 @@ async def get_music_detail_by_id(id: str) -> MusicTrack:
         lyrics_key = f"lyrics_{id}"
         download_key = f"download_{id}"
 
-        # Initialize variables to store results
-        track_info = None
-        lyrics_data = None
-        download_data = None
-
-        # Check cache for each endpoint
-        info_cache = await search_history_collection.find_one(
-            {"query": info_key, "expires_at": {"$gt": datetime.now()}}
-        )
-        lyrics_cache = await search_history_collection.find_one(
-            {"query": lyrics_key, "expires_at": {"$gt": datetime.now()}}
-        )
-        download_cache = await search_history_collection.find_one(
-            {"query": download_key, "expires_at": {"$gt": datetime.now()}}
-        )
+        # One batched cache lookup for all three parts
+        cached = await get_cached_results([info_key, lyrics_key, download_key])
 
-        # Get track info
-        if info_cache:
-            logger.info(f"Using cached track info for track ID: {id}")
-            track_info = info_cache["result"]
-        else:
+        async def load_info():
+            if info_key in cached:
+                logger.info(f"Using cached track info for track ID: {id}")
+                return cached[info_key]
             logger.info(f"Fetching track info for track ID: {id}")
-            track_info = await get_music_infor_by_id(id)
+            track_info = await asyncio.wait_for(
+                _fetch_music_infor(id), timeout=DETAIL_PART_TIMEOUT
+            )
             if not track_info:
                 raise Exception(f"Failed to retrieve track info for ID: {id}")
+            return track_info
 
-        # Debug log to see actual structure
-        logger.debug(
-            f"Track info structure: {json.dumps(track_info, default=str)[:500]}..."
-        )
-
-        # Get lyrics data
-        if lyrics_cache:
-            logger.info(f"Using cached lyrics for track ID: {id}")
-            lyrics_data = lyrics_cache["result"]
-        else:
+        async def load_lyrics():
+            if lyrics_key in cached:
+                logger.info(f"Using cached lyrics for track ID: {id}")
+                return cached[lyrics_key]
             try:
                 logger.info(f"Fetching lyrics for track ID: {id}")
-                lyrics_data = await get_track_lyrics_handler(id)
+                return await asyncio.wait_for(
+                    _fetch_track_lyrics(id), timeout=DETAIL_PART_TIMEOUT
+                )
             except Exception as e:
-                logger.warning(f"Failed to get lyrics for track {id}: {e}")
+                logger.warning(f"Failed to get lyrics for track {id}: {e!r}")
                 # Create a default lyrics response if needed
-                lyrics_data = TrackLyricsResponse(
+                return TrackLyricsResponse(
                     lyrics={
                         "syncType": "UNSYNCED",
                         "lines": [],
@@ -215,19 +222,32 @@ async def get_music_detail_by_id(id: str) -> MusicTrack:
                     hasVocalRemoval=False,
                 )
 
-        # Get download data
-        if download_cache:
-            logger.info(f"Using cached download data for track ID: {id}")
-            download_data = download_cache["result"]
-        else:
+        async def load_download():
+            download_link_refresher.record_access(id, hit=download_key in cached)
+            if download_key in cached:
+                logger.info(f"Using cached download data for track ID: {id}")
+                return cached[download_key]
             try:
                 logger.info(f"Fetching download data for track ID: {id}")
-                download_data = await download_music_handler(id)
+                download_data = await asyncio.wait_for(
+                    _fetch_download(id), timeout=DETAIL_PART_TIMEOUT
+                )
                 if not download_data:
                     raise Exception(f"Failed to retrieve download data for ID: {id}")
+                return download_data
             except Exception as e:
-                logger.warning(f"Failed to get download URL for track {id}: {e}")
-                raise Exception(f"Unable to get download information for track: {e}")
+                logger.warning(f"Failed to get download URL for track {id}: {e!r}")
+                raise Exception(f"Unable to get download information for track: {e!r}")
+
+        # Fetch the missing parts concurrently instead of one after another
+        track_info, lyrics_data, download_data = await asyncio.gather(
+            load_info(), load_lyrics(), load_download()
+        )
+
+        # Debug log to see actual structure
+        logger.debug(
+            f"Track info structure: {json.dumps(track_info, default=str)[:500]}..."
+        )
 
         # Construct the MusicTrack object
         try:
@@ -336,137 +356,187 @@ async def get_music_infor_by_id(id: str):
     try:
         # Check if details are already cached
         query_key = f"track_infor_{id}"
-        cached_detail = await search_history_collection.find_one(
-            {"query": query_key, "expires_at": {"$gt": datetime.now()}}
-        )
+        cached_detail = await get_cached_result(query_key)
 
         if cached_detail:
             logger.info(f"Found cached details for track ID: {id}")
-            return cached_detail["result"]
+            return cached_detail
 
         # Make API request if not cached
-        url = f"{RAPID_API_URL}/tracks"
-        querystring = {"ids": id}
+        return await _fetch_music_infor(id)
+    except Exception as e:
+        logger.error(f"Error getting music detail by id: {e}")
+        raise e
 
-        headers = {
-            "x-rapidapi-key": RAPID_API_KEY,
-            "x-rapidapi-host": RAPID_API_HOST,
-        }
 
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        result = response.json()
+async def _fetch_music_infor(id: str):
+    query_key = f"track_infor_{id}"
+    url = f"{RAPID_API_URL}/tracks"
+    querystring = {"ids": id}
+
+    async def fetch():
+        result = await rapidapi_get(url, RAPID_API_HOST, querystring)
 
         # Save to cache
-        await search_history_collection.update_one(
-            {"query": query_key},
-            {
-                "$set": {
-                    "result": result,
-                    "expires_at": datetime.now() + timedelta(days=CACHE_EXPIRE_TIME),
-                }
-            },
-            upsert=True,
+        await set_cached_result(query_key, result, timedelta(days=CACHE_EXPIRE_TIME))
+        return result
+
+    return await track_info_flight.do(query_key, fetch)
+
+
+async def get_music_infor_by_ids(ids: List[str]) -> List[Optional[dict]]:
+    """Batch get_music_infor_by_id, returned in request order (None if unknown)"""
+    try:
+        unique_ids = list(dict.fromkeys(ids))
+        cached = await get_cached_results([f"track_infor_{id}" for id in unique_ids])
+        results: Dict[str, dict] = {
+            id: cached[f"track_infor_{id}"]
+            for id in unique_ids
+            if f"track_infor_{id}" in cached
+        }
+
+        uncached = [id for id in unique_ids if id not in results]
+        logger.info(
+            f"Batch track info: {len(results)} cached, {len(uncached)} to fetch"
         )
+        chunks = [
+            uncached[i : i + TRACKS_UPSTREAM_BATCH_SIZE]
+            for i in range(0, len(uncached), TRACKS_UPSTREAM_BATCH_SIZE)
+        ]
+        fetched = await asyncio.gather(*(_fetch_music_infor_chunk(c) for c in chunks))
+        for chunk_results in fetched:
+            results.update(chunk_results)
 
-        return result
+        return [results.get(id) for id in ids]
     except Exception as e:
-        logger.error(f"Error getting music detail by id: {e}")
+        logger.error(f"Error getting music infor by ids: {e}")
         raise e
 
 
+async def _fetch_music_infor_chunk(ids: List[str]) -> Dict[str, dict]:
+    """Fetch several tracks in one /tracks call and cache them per id"""
+    url = f"{RAPID_API_URL}/tracks"
+    querystring = {"ids": ",".join(ids)}
+    response_data = await rapidapi_get(url, RAPID_API_HOST, querystring)
+
+    # Store each track in the same shape as a single-id /tracks response
+    results = {}
+    for track in response_data.get("tracks") or []:
+        if track and track.get("id") in ids:
+            results[track["id"]] = {"tracks": [track]}
+
+    await set_cached_results(
+        {f"track_infor_{id}": result for id, result in results.items()},
+        timedelta(days=CACHE_EXPIRE_TIME),
+    )
+    return results
+
+
+async def get_music_details_by_ids(ids: List[str]) -> List[Optional[MusicTrack]]:
+    """Batch get_music_detail_by_id, returned in request order (None on failure)"""
+    # Warm the track info cache with a handful of multi-id calls first
+    try:
+        await get_music_infor_by_ids(ids)
+    except Exception as e:
+        logger.warning(f"Batch track info prefetch failed: {e}")
+
+    semaphore = asyncio.Semaphore(DETAIL_BATCH_CONCURRENCY)
+
+    async def detail(id: str):
+        try:
+            async with semaphore:
+                return await get_music_detail_by_id(id)
+        except Exception as e:
+            logger.warning(f"Failed to get detail for track {id}: {e}")
+            return None
+
+    unique_ids = list(dict.fromkeys(ids))
+    details = await asyncio.gather(*(detail(id) for id in unique_ids))
+    by_id = dict(zip(unique_ids, details))
+    return [by_id[id] for id in ids]
+
+
 async def download_music_handler(id: str):
     try:
         # Check if this download is already cached
         query_key = f"download_{id}"
-        cached_download = await search_history_collection.find_one(
-            {"query": query_key, "expires_at": {"$gt": datetime.now()}}
-        )
+        cached_download = await get_cached_result(query_key)
 
+        download_link_refresher.record_access(id, hit=bool(cached_download))
         if cached_download:
             logger.info(f"Found cached download for track ID: {id}")
-            result = DownloadTrackResponse(**cached_download["result"])
+            result = DownloadTrackResponse(**cached_download)
             return result
 
         # Make API request if not cached
-        querystring = {"songId": f"https://open.spotify.com/track/{id}"}
-        headers = {
-            "x-rapidapi-key": RAPID_API_KEY,
-            "x-rapidapi-host": RAPID_API_DOWNLOAD_HOST,
-        }
+        return await _fetch_download(id)
+    except Exception as e:
+        logger.error(f"Error downloading music: {e}")
+        raise e
 
-        response = requests.get(
-            RAPID_API_DOWNLOAD_URL, headers=headers, params=querystring
+
+async def _fetch_download(id: str) -> DownloadTrackResponse:
+    query_key = f"download_{id}"
+    querystring = {"songId": f"https://open.spotify.com/track/{id}"}
+
+    async def fetch():
+        response_data = await rapidapi_get(
+            RAPID_API_DOWNLOAD_URL, RAPID_API_DOWNLOAD_HOST, querystring
         )
-        response.raise_for_status()
-        response_data = response.json()
 
         # Parse into Pydantic model
         result = DownloadTrackResponse(**response_data)
 
         # Save to cache
-        await search_history_collection.update_one(
-            {"query": query_key},
-            {
-                "$set": {
-                    "result": result.model_dump(),
-                    "expires_at": datetime.now() + timedelta(minutes=14),
-                }
-            },
-            upsert=True,
-        )
-
+        ttl = timedelta(seconds=DOWNLOAD_LINK_TTL)
+        await set_cached_result(query_key, result.model_dump(), ttl)
         return result
-    except Exception as e:
-        logger.error(f"Error downloading music: {e}")
-        raise e
+
+    return await download_flight.do(query_key, fetch)
+
+
+async def get_download_link(id: str, refresh: bool = False) -> Optional[str]:
+    """Upstream audio URL of a track; refresh skips the cached link"""
+    result = await (_fetch_download(id) if refresh else download_music_handler(id))
+    return result.data.downloadLink if result.data else None
 
 
 async def get_track_lyrics_handler(id: str):
     try:
         # Check if lyrics are already cached
         query_key = f"lyrics_{id}"
-        cached_lyrics = await search_history_collection.find_one(
-            {"query": query_key, "expires_at": {"$gt": datetime.now()}}
-        )
+        cached_lyrics = await get_cached_result(query_key)
 
         if cached_lyrics:
             logger.info(f"Found cached lyrics for track ID: {id}")
-            result = TrackLyricsResponse(**cached_lyrics["result"])
+            result = TrackLyricsResponse(**cached_lyrics)
             return result
 
         # Make API request if not cached
-        url = f"{RAPID_API_URL}/track_lyrics/"
-        querystring = {"id": id}
+        return await _fetch_track_lyrics(id)
+    except Exception as e:
+        logger.error(f"Error getting track lyrics: {e}")
+        raise e
 
-        headers = {
-            "x-rapidapi-key": RAPID_API_KEY,
-            "x-rapidapi-host": RAPID_API_HOST,
-        }
 
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        response_data = response.json()
+async def _fetch_track_lyrics(id: str) -> TrackLyricsResponse:
+    query_key = f"lyrics_{id}"
+    url = f"{RAPID_API_URL}/track_lyrics/"
+    querystring = {"id": id}
+
+    async def fetch():
+        response_data = await rapidapi_get(url, RAPID_API_HOST, querystring)
 
         # Parse into Pydantic model
         result = TrackLyricsResponse(**response_data)
 
         # Save to cache
-        await search_history_collection.update_one(
-            {"query": query_key},
-            {
-                "$set": {
-                    "result": result.model_dump(),
-                    "expires_at": datetime.now() + timedelta(days=CACHE_EXPIRE_TIME),
-                }
-            },
-            upsert=True,
+        await set_cached_result(
+            query_key, result.model_dump(), timedelta(days=CACHE_EXPIRE_TIME)
         )
-
         return result
-    except Exception as e:
-        logger.error(f"Error getting track lyrics: {e}")
-        raise e
+
+    return await lyrics_flight.do(query_key, fetch)
 
 
 async def find_similar_songs_atlas(song_id, n=5, filter_criteria=None):
@@ -480,7 +550,7 @@ async def find_similar_songs_atlas(song_id, n=5, filter_criteria=None):
         "$vectorSearch": {
             "index": "vector_index",
             "path": "embedding",
-            "queryVector": source_song["embedding"],
+            "queryVector": embedding_to_list(source_song["embedding"]),
             "numCandidates": n * 10,  # Retrieve more candidates for better results
             "limit": n + 1,  # +1 to account for the source song
         }
@@ -506,6 +576,7 @@ async def find_similar_songs_atlas(song_id, n=5, filter_criteria=None):
                 "artist": 1,
                 "album": 1,
                 "genre": 1,
+                "canonical_id": 1,
                 "similarity_score": {"$meta": "vectorSearchScore"},
             }
         },
@@ -514,16 +585,49 @@ async def find_similar_songs_atlas(song_id, n=5, filter_criteria=None):
     cursor = tracks_collection.aggregate(pipeline)
     results = await cursor.to_list(length=n)
 
-    return results
+    # Duplicates of canonical tracks are not recommended
+    return [song for song in results if not is_duplicate(song)]
+
+
+SIMILAR_SONG_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "artists": 1,
+    "albumOfTrack": 1,
+    "genre": 1,
+}
+
+
+async def _load_similar_songs(hits):
+    """Fetch display fields for (id, score) hits, keeping their order"""
+    if not hits:
+        return []
+    cursor = tracks_collection.find(
+        {"_id": {"$in": [id for id, _ in hits]}}, SIMILAR_SONG_PROJECTION
+    )
+    songs = {song["_id"]: song async for song in cursor}
+    similar_songs = []
+    for id, score in hits:
+        song = songs.get(id)
+        if song:
+            song["similarity_score"] = score
+            similar_songs.append(song)
+    return similar_songs
 
 
 async def find_similar_songs(song_id, n=5, filter_criteria=None):
     """Find similar songs based on embedding similarity"""
+    # Prefer the local ANN index; it covers the whole catalog
+    hits = await vector_index.search(song_id, n, filter_criteria)
+    if hits is not None:
+        return await _load_similar_songs(hits)
+
+    # Index still building: score a bounded sample of the catalog instead
     source_song = await tracks_collection.find_one({"_id": song_id})
     if not source_song or "embedding" not in source_song:
         return []
 
-    source_embedding = np.array(source_song["embedding"])
+    source_embedding = decode_embedding(source_song["embedding"]).astype(np.float32)
 
     # Prepare filter criteria
     query = {}
@@ -532,6 +636,8 @@ async def find_similar_songs(song_id, n=5, filter_criteria=None):
 
     # Exclude the source song itself
     query["_id"] = {"$ne": song_id}
+    # Only compare embeddings from the same model
+    query["embedding_model"] = source_song.get("embedding_model")
 
     # Fetch all potential matching songs (this can be optimized with larger datasets)
     cursor = tracks_collection.find(
@@ -543,15 +649,17 @@ async def find_similar_songs(song_id, n=5, filter_criteria=None):
             "albumOfTrack": 1,
             "genre": 1,
             "embedding": 1,
+            "canonical_id": 1,
         },
     )
     potential_matches = await cursor.to_list(length=100)  # Limit to 100 for performance
+    potential_matches = [song for song in potential_matches if not is_duplicate(song)]
 
     # Calculate similarity scores
     similar_songs = []
     for song in potential_matches:
         if "embedding" in song:
-            target_embedding = np.array(song["embedding"])
+            target_embedding = decode_embedding(song["embedding"]).astype(np.float32)
             # Compute cosine similarity
             similarity = np.dot(source_embedding, target_embedding) / (
                 np.linalg.norm(source_embedding) * np.linalg.norm(target_embedding)
@@ -566,47 +674,134 @@ async def find_similar_songs(song_id, n=5, filter_criteria=None):
     return similar_songs[:n]
 
 
-async def get_popular_songs_from_api(country: Country):
-    try:
-        # Convert country to lowercase and handle special case
-        country_key = country.lower()
-
-        # Map of available mock files
-        mock_files = {
-            "vn": "popular_vn_songs.json",
-            "global": "popular_global_songs.json",
-            "kr": "porpular_kr_songs.json",  # Note typo in filename
-            "us": "porpular_usuk_songs.json",  # Note typo in filename
-            "gb": "porpular_usuk_songs.json",  # Use same file for GB
-        }
+async def similar_songs_handler(song_id, n=5, filter_criteria=None):
+    """Similar songs, cached per (song_id, filter) and catalog generation.
 
-        # Default to global if country not found
-        if country_key not in mock_files:
-            logger.warning(f"No mock data for country {country}, using global")
-            country_key = "global"
+    The cached list is sliced for requests with a smaller n; a larger n
+    recomputes and replaces it.
+    """
+    generation = await get_catalog_generation()
+    query_key = (
+        f"similar_{generation}_{song_id}_"
+        f"{json.dumps(filter_criteria or {}, sort_keys=True)}"
+    )
+    cached = await get_cached_result(query_key)
+    # A short list is not proof of exhaustion: duplicates are dropped after
+    # the source query limits, so only a list computed for n or more is reused
+    if cached and cached["n"] >= n:
+        return cached["songs"][:n]
 
-        # Use absolute path instead of relative path
-        import os
+    # Use MongoDB Atlas vector search if available
+    try:
+        similar_songs = await find_similar_songs_atlas(song_id, n, filter_criteria)
+    except Exception:
+        # Fall back to custom implementation
+        similar_songs = await find_similar_songs(song_id, n, filter_criteria)
+
+    if similar_songs:
+        await set_cached_result(
+            query_key,
+            {"n": n, "songs": similar_songs},
+            timedelta(seconds=SIMILAR_SONGS_CACHE_TTL),
+        )
+    return similar_songs
 
-        base_dir = os.path.dirname(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+async def _similar_hits_by_scan(song_ids, n, filter_criteria=None):
+    """Per-seed hits from a bounded sample of the catalog, scored as one
+    seeds x candidates matrix product (used while the index is building)"""
+    seeds = {}
+    cursor = tracks_collection.find(
+        {"_id": {"$in": song_ids}, "embedding": {"$exists": True}},
+        {"embedding": 1, "embedding_model": 1},
+    )
+    async for doc in cursor:
+        seeds[doc["_id"]] = doc
+    seed_ids = [id for id in dict.fromkeys(song_ids) if id in seeds]
+    if not seed_ids:
+        return {}
+
+    query = dict(filter_criteria or {})
+    query["_id"] = {"$nin": song_ids}
+    query["embedding_model"] = seeds[seed_ids[0]].get("embedding_model")
+    query["embedding"] = {"$exists": True}
+    cursor = tracks_collection.find(
+        query, {"_id": 1, "embedding": 1, "canonical_id": 1}
+    )
+    candidates = await cursor.to_list(length=100)  # Limit to 100 for performance
+    candidates = [doc for doc in candidates if not is_duplicate(doc)]
+    if not candidates:
+        return {id: [] for id in seed_ids}
+
+    seed_matrix = normalize_vectors(
+        np.stack([decode_embedding(seeds[id]["embedding"]) for id in seed_ids]).astype(
+            np.float32
         )
-        file_path = os.path.join(base_dir, "mocks", mock_files[country_key])
-
-        # Check if file exists
-        if not os.path.exists(file_path):
-            logger.warning(f"Mock file {file_path} not found, using global")
-            file_path = os.path.join(base_dir, "mocks", "popular_global_songs.json")
-
-            # If global file also doesn't exist, use fallback data
-            if not os.path.exists(file_path):
-                logger.warning(f"Global mock file also not found, using hardcoded data")
-                raise FileNotFoundError("All mock files are missing")
-
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            logger.info(f"Successfully loaded mock data from {file_path}")
-            return PopularSongsResponse(data=data)
+    )
+    candidate_matrix = normalize_vectors(
+        np.stack([decode_embedding(doc["embedding"]) for doc in candidates]).astype(
+            np.float32
+        )
+    )
+    scores = seed_matrix @ candidate_matrix.T
+    hits = {}
+    for id, row in zip(seed_ids, scores):
+        top = np.argsort(-row)[:n]
+        hits[id] = [(candidates[i]["_id"], float(row[i])) for i in top]
+    return hits
+
+
+async def find_similar_songs_batch(song_ids, n=5, filter_criteria=None, merge=False):
+    """Similar songs for many seeds in one pass.
+
+    Returns the top n per seed and, if merge is set, one de-duplicated list
+    ranked by each song's best score over all seeds. Seeds are excluded from
+    every list.
+    """
+    hits = await vector_index.search_many(song_ids, n, filter_criteria)
+    if hits is None:
+        hits = await _similar_hits_by_scan(song_ids, n, filter_criteria)
+
+    merged_hits = []
+    if merge:
+        best = {}
+        for seed_hits in hits.values():
+            for id, score in seed_hits:
+                if score > best.get(id, -np.inf):
+                    best[id] = score
+        merged_hits = sorted(best.items(), key=lambda hit: hit[1], reverse=True)[:n]
+
+    # One lookup for the display fields of every song in the response
+    songs = {
+        song["_id"]: song
+        for song in await _load_similar_songs(
+            list(
+                {id: 0.0 for seed_hits in hits.values() for id, _ in seed_hits}.items()
+            )
+        )
+    }
+
+    def with_scores(seed_hits):
+        return [
+            {**songs[id], "similarity_score": score}
+            for id, score in seed_hits
+            if id in songs
+        ]
+
+    return {
+        "results": {id: with_scores(seed_hits) for id, seed_hits in hits.items()},
+        "merged": with_scores(merged_hits) if merge else None,
+        "missing": [id for id in song_ids if id not in hits],
+    }
+
+
+async def get_popular_songs_from_api(country: Country):
+    try:
+        # Parsed once at startup and reloaded only when the file changes
+        popular_songs = chart_datasets.songs_response(country)
+        if popular_songs is None:
+            raise FileNotFoundError("All mock files are missing")
+        return popular_songs
     except Exception as e:
         logger.error(f"Error getting popular songs: {e}")
         # Fallback to hardcoded data if all else fails
@@ -645,88 +840,219 @@ async def get_popular_songs_from_api(country: Country):
         return PopularSongsResponse(data=fallback_data)
 
 
-async def get_popular_songs_handler(country: Country):
-    """Get popular songs from Audius API with improved performance"""
-    try:
-        # Check cache for final results with a more specific key (including timestamp)
-        cache_key = f"popular_songs_{country}"
-        cached_results = await search_history_collection.find_one(
-            {"query": cache_key, "expires_at": {"$gt": datetime.now()}}
-        )
+def get_chart_songs_handler(
+    country: Country,
+    genre: Optional[str] = None,
+    artist: Optional[str] = None,
+    year: Optional[str] = None,
+) -> Optional[List[PopularSong]]:
+    """Chart songs of a country, filtered by genre, artist and year"""
+    return chart_datasets.songs(country, genre, artist, year)
 
-        if cached_results:
-            logger.info(f"Found cached popular songs for {country}")
-            return cached_results["result"]["items"]
 
-        # If not cached, proceed with API calls
-        popular_songs = await get_popular_songs_from_api(country)
+def get_popular_albums_handler(country: Country) -> Optional[List[PopularAlbum]]:
+    return chart_datasets.albums(country)
 
-        import random
 
-        # Limit to 10 songs to reduce processing time
-        sample_size = min(10, len(popular_songs.data))
-        popular_songs = random.sample(popular_songs.data, sample_size)
+def get_popular_artists_handler(country: Country) -> Optional[List[PopularArtist]]:
+    return chart_datasets.artists(country)
 
-        # Use a semaphore to limit concurrent API calls (to avoid rate limiting)
-        semaphore = asyncio.Semaphore(5)  # Maximum 5 concurrent requests
 
-        async def search_with_timeout(song):
-            """Execute search with timeout and semaphore to prevent hanging"""
-            try:
-                async with semaphore:
-                    song_name = song.title
-                    artist_name = song.artist
-                    # Use a timeout to prevent slow API calls
-                    return await asyncio.wait_for(
-                        search_music_handler(
-                            TrackSearch(query=f"{song_name} {artist_name}", limit=1)
-                        ),
-                        timeout=5.0,  # 5 second timeout
+class PopularSongsJob:
+    """One resolution of a country's popular songs to tracks via search.
+
+    Searches run in the background and each result is recorded as soon as
+    it completes, so callers can read the partial list or stream results
+    in completion order while the slower searches are still running.
+    """
+
+    def __init__(self, country: Country):
+        self.country = country
+        self.items: List[Optional[dict]] = []
+        self.completed: List[int] = []  # indexes, in completion order
+        self.finished = False
+        self._updated = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> Dict[str, List[Optional[dict]]]:
+        try:
+            popular_songs = await get_popular_songs_from_api(country=self.country)
+
+            import random
+
+            # Limit to 10 songs to reduce processing time
+            sample_size = min(10, len(popular_songs.data))
+            popular_songs = random.sample(popular_songs.data, sample_size)
+            self.items = [None] * len(popular_songs)
+
+            # Use a semaphore to limit concurrent API calls (to avoid rate limiting)
+            semaphore = asyncio.Semaphore(5)  # Maximum 5 concurrent requests
+
+            async def search_with_timeout(index, song):
+                """Execute search with timeout and semaphore to prevent hanging"""
+                # Songs resolved before need no upstream search
+                resolved = await song_resolver.resolve(song.title, song.artist)
+                if resolved is not None:
+                    return index, resolved
+                try:
+                    async with semaphore:
+                        song_name = song.title
+                        artist_name = song.artist
+                        # Use a timeout to prevent slow API calls
+                        track_data = await asyncio.wait_for(
+                            search_music_handler(
+                                TrackSearch(query=f"{song_name} {artist_name}", limit=1)
+                            ),
+                            timeout=5.0,  # 5 second timeout
+                        )
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        f"Timeout searching for {song.title} by {song.artist}"
                     )
-            except asyncio.TimeoutError:
-                logger.warning(f"Timeout searching for {song.title} by {song.artist}")
-                return None
-            except Exception as e:
-                logger.warning(f"Error searching for {song.title}: {str(e)}")
-                return None
-
-        # Create and execute search tasks with better error handling
-        search_tasks = [search_with_timeout(song) for song in popular_songs]
-        search_results = await asyncio.gather(*search_tasks)
-
-        # Process results
-        result = []
-        serializable_result = []
-
-        for i, track_data in enumerate(search_results):
-            if (
-                not track_data
-                or not hasattr(track_data, "items")
-                or not track_data.items
-            ):
-                # Skip invalid results
-                result.append(None)
-                serializable_result.append(None)
-                continue
-
-            track_item = track_data.items[0]
-            result.append(track_item)
-            serializable_result.append(track_item.model_dump())
-
-        # Cache the final results with a reasonable expiration time
-        await search_history_collection.update_one(
-            {"query": cache_key},
-            {
-                "$set": {
-                    "result": {"items": serializable_result},
-                    "expires_at": datetime.now()
-                    + timedelta(hours=24),  # Increase cache time
-                }
-            },
-            upsert=True,
+                    track_data = None
+                except Exception as e:
+                    logger.warning(f"Error searching for {song.title}: {str(e)}")
+                    track_data = None
+                if track_data and getattr(track_data, "items", None):
+                    item = track_data.items[0]
+                    if item.data and item.data.id:
+                        try:
+                            await song_resolver.record(
+                                song.title, song.artist, item.data.id
+                            )
+                        except Exception as e:
+                            logger.warning(f"Error recording {song.title}: {str(e)}")
+                    return index, item.model_dump()
+                # Keep the slot for invalid results
+                return index, None
+
+            searches = [
+                search_with_timeout(index, song)
+                for index, song in enumerate(popular_songs)
+            ]
+            for search in asyncio.as_completed(searches):
+                index, item = await search
+                self.items[index] = item
+                self.completed.append(index)
+                async with self._updated:
+                    self._updated.notify_all()
+            return {"items": self.items}
+        finally:
+            self.finished = True
+            async with self._updated:
+                self._updated.notify_all()
+
+    async def result(self) -> Dict[str, List[Optional[dict]]]:
+        return await asyncio.shield(self.task)
+
+    async def stream(self):
+        """Yield (index, item) in completion order, starting with any
+        results that completed before the caller subscribed"""
+        sent = 0
+        while True:
+            while sent < len(self.completed):
+                index = self.completed[sent]
+                sent += 1
+                yield index, self.items[index]
+            if self.finished:
+                return
+            async with self._updated:
+                await self._updated.wait_for(
+                    lambda: self.finished or sent < len(self.completed)
+                )
+
+
+# Latest resolution per country; a finished job is replaced on next use
+_popular_songs_jobs: Dict[str, PopularSongsJob] = {}
+
+
+def _popular_songs_job(country: Country) -> PopularSongsJob:
+    job = _popular_songs_jobs.get(country)
+    if job is None or job.finished:
+        job = PopularSongsJob(country)
+        _popular_songs_jobs[country] = job
+    return job
+
+
+def _popular_songs_lookup(country: Country) -> asyncio.Task:
+    """Cached popular songs; on a miss, resolves and caches them.
+
+    Runs as its own task so a caller that stops waiting does not stop the
+    resolution or the caching of its result.
+    """
+    lookup = asyncio.ensure_future(
+        popular_songs_swr.get(
+            f"popular_songs_{country}",
+            lambda: _popular_songs_job(country).result(),
+            timedelta(seconds=POPULAR_SONGS_FRESH_TTL),
+            timedelta(seconds=POPULAR_SONGS_TTL),
         )
+    )
+    lookup.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return lookup
 
-        return result
+
+async def get_popular_songs_handler(
+    country: Country, response: Optional[Response] = None
+):
+    """Get popular songs from Audius API with improved performance.
+
+    On a cold cache, the items resolved within POPULAR_SONGS_PARTIAL_WAIT
+    are returned, marked X-Cache: partial with the number of songs still
+    resolving in X-Pending, and the rest keeps resolving in the background,
+    so the next caller gets the full, cached list.
+    """
+    try:
+        lookup = _popular_songs_lookup(country)
+        done, _ = await asyncio.wait({lookup}, timeout=POPULAR_SONGS_PARTIAL_WAIT)
+        if not done:
+            job = _popular_songs_jobs.get(country)
+            items = list(job.items) if job else []
+            pending = len(items) - len(job.completed) if job else 0
+            CacheStatus("partial", 0).apply(response)
+            if response is not None:
+                response.headers["X-Pending"] = str(pending)
+            # Only resolved songs: clients iterate the items as tracks
+            return [item for item in items if item is not None]
+
+        # Past the fresh TTL the cached list is served while it refreshes
+        cached_results, status = lookup.result()
+        status.apply(response)
+        return cached_results["items"]
     except Exception as e:
         logger.error(f"Error getting popular songs: {e}")
         raise e
+
+
+async def stream_popular_songs(country: Country):
+    """Yield {"index", "item", "total"} for each popular song as it resolves.
+
+    Cached lists are emitted at once; otherwise items arrive in the order
+    their searches complete, tagged with their position in the list.
+    """
+    entry = await get_cached_entry(f"popular_songs_{country}")
+    if entry is not None and datetime.now() < entry["expires_at"]:
+        # Served from cache (stale entries also get refreshed in the background)
+        cached_results, _ = await _popular_songs_lookup(country)
+        items = cached_results["items"]
+        for index, item in enumerate(items):
+            yield {"index": index, "item": item, "total": len(items)}
+        return
+
+    job = _popular_songs_job(country)
+    # Caches the full list once the job finishes, even if the client leaves
+    _popular_songs_lookup(country)
+    async for index, item in job.stream():
+        yield {"index": index, "item": item, "total": len(job.items)}
+    await job.result()
+
+
+async def warm_popular_songs(country: Country, horizon: timedelta) -> bool:
+    """Refresh a country's popular songs ahead of them turning stale"""
+    return await popular_songs_swr.warm(
+        f"popular_songs_{country}",
+        lambda: _popular_songs_job(country).result(),
+        timedelta(seconds=POPULAR_SONGS_FRESH_TTL),
+        timedelta(seconds=POPULAR_SONGS_TTL),
+        horizon,
+    )
@@ -0,0 +1,135 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import (
+    logger,
+    CHART_PREWARM_INTERVAL,
+    CHART_PREWARM_JITTER,
+    CHART_PUBLISH_HOUR,
+    CHART_PUBLISH_WEEKDAY,
+    CHART_PREWARM_LOCK_LEASE,
+)
+from models.tracks import Country, Period, TopTrendingTracks
+from services.locks import MongoLock
+from services.music_service import warm_popular_songs, warm_top_trending_tracks
+
+
+class ChartPrewarmer:
+    """Refreshes every top-200 chart and popular-songs list in the background.
+
+    Runs every interval seconds, and additionally just after CHART_PUBLISH_HOUR,
+    when the upstream has published new daily charts; that run refreshes
+    the daily charts even if they are still fresh, and the weekly charts
+    too on CHART_PUBLISH_WEEKDAY, when a new weekly chart is out. Each run
+    waits a random jitter so workers do not wake together, and takes a
+    Mongo lease lock so only one worker across all replicas does the
+    refresh.
+    """
+
+    def __init__(self, interval: int, jitter: int, lease: int):
+        self.interval = interval
+        self.jitter = jitter
+        self.lock = MongoLock("chart_prewarm", timedelta(seconds=lease))
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.skipped_locked = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_run_seconds = 0.0
+        self.next_run_at: Optional[datetime] = None
+
+    async def start(self):
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.lock.release()
+
+    def _next_run(self, now: datetime) -> Tuple[datetime, bool]:
+        """Next run time, and whether it is the post-publish run"""
+        publish = now.replace(
+            hour=CHART_PUBLISH_HOUR, minute=0, second=0, microsecond=0
+        )
+        if publish <= now:
+            publish += timedelta(days=1)
+        run_at, after_publish = now + timedelta(seconds=self.interval), False
+        if publish <= run_at:
+            run_at, after_publish = publish, True
+        return run_at + timedelta(seconds=random.uniform(0, self.jitter)), after_publish
+
+    async def _loop(self):
+        # First run shortly after startup, staggered across workers
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        force = False
+        while True:
+            try:
+                await self.run_once(force)
+            except Exception as e:
+                logger.error(f"Error pre-warming charts: {e}")
+            self.next_run_at, force = self._next_run(datetime.now())
+            delay = (self.next_run_at - datetime.now()).total_seconds()
+            await asyncio.sleep(max(0.0, delay))
+
+    async def run_once(self, force: bool = False):
+        # The lease is not released after the run: workers waking later in
+        # the same jitter window find it held and skip
+        if not await self.lock.acquire():
+            self.skipped_locked += 1
+            return
+        started = time.perf_counter()
+        # Anything that would turn stale before the next run is refreshed now
+        horizon = timedelta(seconds=self.interval + self.jitter)
+        weekly_published = datetime.now().weekday() == CHART_PUBLISH_WEEKDAY
+        jobs = [
+            (
+                f"top-200 {country.value}/{period.value}",
+                lambda country=country, period=period: warm_top_trending_tracks(
+                    TopTrendingTracks(country=country, period=period),
+                    horizon,
+                    force and (period != Period.weekly or weekly_published),
+                ),
+            )
+            for country in Country
+            for period in Period
+        ] + [
+            (
+                f"popular songs {country.value}",
+                lambda country=country: warm_popular_songs(country, horizon),
+            )
+            for country in Country
+        ]
+        # One at a time to stay well inside the upstream rate limits
+        for name, warm in jobs:
+            try:
+                if await warm():
+                    self.refreshed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Pre-warming {name} failed: {e}")
+        self.runs += 1
+        self.last_run_at = datetime.now()
+        self.last_run_seconds = time.perf_counter() - started
+        logger.info(f"Pre-warmed charts in {self.last_run_seconds:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "skipped_locked": self.skipped_locked,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_seconds": round(self.last_run_seconds, 4),
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+        }
+
+
+chart_prewarmer = ChartPrewarmer(
+    CHART_PREWARM_INTERVAL, CHART_PREWARM_JITTER, CHART_PREWARM_LOCK_LEASE
+)
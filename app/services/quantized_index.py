@@ -0,0 +1,152 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.embedding_store import EmbeddingStore, normalize_vectors
+
+QUANTIZE_CHUNK_ROWS = 16384
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-vector scalar quantization: x ~= scale * code + offset, with codes
+    in [-127, 127]"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    high = vectors.max(axis=1)
+    low = vectors.min(axis=1)
+    offset = (high + low) / 2
+    scale = (high - low) / 254
+    scale[scale == 0] = 1.0
+    codes = np.rint((vectors - offset[:, None]) / scale[:, None])
+    return np.clip(codes, -127, 127).astype(np.int8), scale, offset
+
+
+class QuantizedVectors:
+    """Int8 copy of the rows of an EmbeddingStore for shortlist scoring.
+
+    Each row keeps its int8 codes plus a float32 scale, offset and code sum,
+    about a quarter of the float32 row. Search scores rows with integer dot
+    products against the quantized query, so the float32 matrix is not
+    paged in on the query path; callers re-rank the shortlist at full
+    precision.
+    """
+
+    def __init__(self, store: EmbeddingStore):
+        self.store = store
+        self.codes = np.zeros((0, store.dim or 0), dtype=np.int8)
+        self.scale = np.zeros(0, dtype=np.float32)
+        self.offset = np.zeros(0, dtype=np.float32)
+        self.code_sums = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.scale)
+
+    def extend(self, vectors: np.ndarray):
+        """Quantize rows appended to the store (rows never change in place)"""
+        if len(vectors) == 0:
+            return
+        parts = [
+            quantize_int8(vectors[start : start + QUANTIZE_CHUNK_ROWS])
+            for start in range(0, len(vectors), QUANTIZE_CHUNK_ROWS)
+        ]
+        # The store's dimension is unknown until its first row is written
+        existing = [self.codes] if len(self) else []
+        self.codes = np.concatenate(existing + [p[0] for p in parts])
+        self.scale = np.concatenate([self.scale] + [p[1] for p in parts])
+        self.offset = np.concatenate([self.offset] + [p[2] for p in parts])
+        self.code_sums = np.concatenate(
+            [self.code_sums] + [p[0].sum(axis=1, dtype=np.int32) for p in parts]
+        )
+
+    def scores(self, query, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate dot products of the (normalized) query with each row"""
+        query = normalize_vectors(np.asarray(query, dtype=np.float32))
+        q_codes, q_scale, q_offset = quantize_int8(query)
+        q_codes = q_codes[0].astype(np.int32)
+        q_sum = float(q_scale[0] * q_codes.sum() + q_offset[0] * len(q_codes))
+
+        rows = np.arange(len(self)) if rows is None else rows
+        dots = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), QUANTIZE_CHUNK_ROWS):
+            block = self.codes[rows[start : start + QUANTIZE_CHUNK_ROWS]]
+            dots[start : start + QUANTIZE_CHUNK_ROWS] = block.astype(np.int32) @ q_codes
+        # (s_i c_i + o_i) . (s_q c_q + o_q) expanded; only dots needs integer math
+        scale = self.scale[rows]
+        return (
+            scale * (q_scale[0] * dots + q_offset[0] * self.code_sums[rows])
+            + self.offset[rows] * q_sum
+        )
+
+    def search(
+        self,
+        query,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[Tuple[str, float]]:
+        """Approximate top-k with the same contract as EmbeddingStore.search"""
+        size = len(self)
+        if size == 0 or len(query) != self.codes.shape[1]:
+            return []
+        alive = self.store.alive[:size]
+        allowed = alive if mask is None else alive & mask[:size]
+        rows = np.flatnonzero(allowed) if rows is None else rows[rows < size]
+        rows = rows[allowed[rows]]
+        k = min(k, len(rows))
+        if k <= 0:
+            return []
+        scores = self.scores(query, rows)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.store.ids[rows[i]], float(scores[i])) for i in top]
+
+    def stats(self) -> Dict[str, int]:
+        dim = self.codes.shape[1] if self.codes.ndim == 2 else 0
+        return {
+            "rows": len(self),
+            "bytes": int(
+                self.codes.nbytes
+                + self.scale.nbytes
+                + self.offset.nbytes
+                + self.code_sums.nbytes
+            ),
+            "float32_bytes": int(len(self) * dim * 4),
+        }
+
+
+def evaluate_recall(
+    store: EmbeddingStore,
+    quantized: QuantizedVectors,
+    k: int,
+    shortlists: List[int],
+    samples: int,
+    seed: int = 0,
+) -> Dict:
+    """recall@k of int8 shortlisting plus full-precision re-ranking, against
+    exact float32 search, for queries sampled from the store's own rows"""
+    live = np.flatnonzero(store.alive[: len(quantized)])
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(live, min(samples, len(live)), replace=False)
+    found = {size: 0 for size in shortlists}
+    found_without_rerank = 0
+    expected = 0
+    for row in queries:
+        vector = np.asarray(store.matrix[row])
+        mask = np.ones(len(store.alive), dtype=bool)
+        mask[row] = False
+        exact = {id for id, _ in store.search(vector, k, mask=mask)}
+        expected += len(exact)
+        approx = quantized.search(vector, max(max(shortlists), k), mask=mask)
+        found_without_rerank += len(exact & {id for id, _ in approx[:k]})
+        for size in shortlists:
+            rows = np.array([store.rows[id] for id, _ in approx[: max(size, k)]])
+            reranked = store.search(vector, k, rows=rows) if len(rows) else []
+            found[size] += len(exact & {id for id, _ in reranked})
+    expected = max(expected, 1)
+    return {
+        "k": k,
+        "samples": len(queries),
+        "recall_without_rerank": round(found_without_rerank / expected, 4),
+        "recall_by_shortlist": {
+            str(size): round(found[size] / expected, 4) for size in shortlists
+        },
+    }
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight fetch.
+
+    The first caller for a key starts the fetch; callers arriving while it is
+    still running await the same task and receive its result or its error.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        # Shield so a cancelled caller does not cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def is_running(self, key: str) -> bool:
+        return key in self._calls
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": self.in_flight(),
+        }
+
+
+# One registry per upstream endpoint so the counters show where quota is saved
+search_flight = SingleFlight("search")
+track_info_flight = SingleFlight("track_info")
+download_flight = SingleFlight("download")
+lyrics_flight = SingleFlight("lyrics")
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    return {
+        flight.name: flight.stats()
+        for flight in (search_flight, track_info_flight, download_flight, lyrics_flight)
+    }
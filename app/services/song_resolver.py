@@ -0,0 +1,192 @@
+import re
+import unicodedata
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+
+from core.config import (
+    logger,
+    SONG_RESOLVER_FUZZY_THRESHOLD,
+    SONG_RESOLVER_FUZZY_CANDIDATES,
+)
+from db.mongo import tracks_collection, song_resolutions_collection
+from models.tracks import Track, TrackItem
+
+# Fields of a stored track that make up a search result item
+_TRACK_FIELDS = {
+    field: 1
+    for field in (
+        "uri",
+        "id",
+        "name",
+        "albumOfTrack",
+        "artists",
+        "contentRating",
+        "duration",
+        "playability",
+    )
+}
+_FEATURING = re.compile(r"[(\[]\s*(feat|ft|with)\b[^)\]]*[)\]]|\s(feat|ft)\b.*$")
+_VERSION_TAGS = re.compile(
+    r"[(\[]\s*(explicit|clean)\b[^)\]]*[)\]]|\s-\s*(explicit|clean)\b.*$"
+)
+_BRACKETED = re.compile(r"[(\[][^)\]]*[)\]]")
+_ARTIST_SEPARATORS = re.compile(r"\s*(?:,|&|\bx\b|\bfeat\b|\bft\b|\bwith\b)\s*")
+# Letters that do not decompose into a base letter plus a combining mark
+_FOLDED_LETTERS = str.maketrans({"đ": "d", "ð": "d", "ø": "o", "ł": "l", "ß": "ss"})
+
+
+def fold_text(text: str) -> str:
+    """Lowercase and strip diacritics ("Phép Màu" -> "phep mau", "Đen" -> "den")"""
+    text = unicodedata.normalize("NFKD", text.casefold()).translate(_FOLDED_LETTERS)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _words(text: str) -> str:
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+def normalize_title(title: str) -> str:
+    """Folded title without featured artists or explicit/clean version tags"""
+    title = _VERSION_TAGS.sub(" ", _FEATURING.sub(" ", fold_text(title)))
+    return _words(title)
+
+
+def normalize_artists(artists: str) -> List[str]:
+    """Folded artist names of a credit like "Jung Kook, Latto" or "A & B" """
+    names = (_words(name) for name in _ARTIST_SEPARATORS.split(fold_text(artists)))
+    return [name for name in names if name]
+
+
+def song_key(title: str, artist: str) -> Optional[str]:
+    """Resolution key: normalized title and primary artist"""
+    title = normalize_title(title)
+    artists = normalize_artists(artist)
+    if not title or not artists:
+        return None
+    return f"{title}|{artists[0]}"
+
+
+def track_search_fields(track: Track) -> Dict[str, object]:
+    """Normalized name and artists stored with a track for fuzzy resolution"""
+    artists = track.artists.items if track.artists else []
+    return {
+        "search_title": normalize_title(track.name or ""),
+        "search_artists": [_words(fold_text(a.profile.name)) for a in artists],
+    }
+
+
+def _title_similarity(wanted: str, candidate: str) -> float:
+    """Best ratio of the titles with and without bracketed suffixes"""
+    score = SequenceMatcher(None, wanted, candidate).ratio()
+    bare = _words(_BRACKETED.sub(" ", candidate))
+    if bare and bare != candidate:
+        score = max(score, SequenceMatcher(None, wanted, bare).ratio())
+    return score
+
+
+class SongResolver:
+    """Persistent (title, artist) -> track id index for chart songs.
+
+    Chart files only name their songs, and mapping a name to a track used to
+    cost an upstream search every time. Resolutions are kept in Mongo (and
+    in memory per worker); songs never resolved before are matched against
+    tracks already stored, by primary artist and closest title, before the
+    caller falls back to searching. Searched results are recorded so the
+    next lookup needs no upstream call.
+    """
+
+    def __init__(self):
+        self._resolved: Dict[str, str] = {}
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    async def start(self):
+        await tracks_collection.create_index("search_artists")
+
+    async def resolve(self, title: str, artist: str) -> Optional[dict]:
+        """The stored track for a song as a search result item, or None"""
+        key = song_key(title, artist)
+        if key is None:
+            self.misses += 1
+            return None
+        try:
+            track_id = await self._lookup(key)
+            if track_id is not None:
+                doc = await tracks_collection.find_one({"_id": track_id}, _TRACK_FIELDS)
+                if doc is not None:
+                    self.hits += 1
+                    return _track_item(doc)
+            match = await self._fuzzy_match(key)
+            if match is not None:
+                await self.record(title, artist, match["_id"], source="fuzzy")
+                self.fuzzy_hits += 1
+                return _track_item(match)
+        except Exception as e:
+            logger.warning(f"Error resolving {title} by {artist}: {e}")
+        self.misses += 1
+        return None
+
+    async def record(
+        self, title: str, artist: str, track_id: str, source: str = "search"
+    ):
+        key = song_key(title, artist)
+        if key is None or self._resolved.get(key) == track_id:
+            return
+        await song_resolutions_collection.update_one(
+            {"_id": key},
+            {
+                "$set": {
+                    "track_id": track_id,
+                    "title": title,
+                    "artist": artist,
+                    "source": source,
+                    "updated_at": datetime.now(),
+                }
+            },
+            upsert=True,
+        )
+        self._resolved[key] = track_id
+        self.recorded += 1
+
+    async def _lookup(self, key: str) -> Optional[str]:
+        if key in self._resolved:
+            return self._resolved[key]
+        doc = await song_resolutions_collection.find_one({"_id": key}, {"track_id": 1})
+        if doc is None:
+            return None
+        self._resolved[key] = doc["track_id"]
+        return doc["track_id"]
+
+    async def _fuzzy_match(self, key: str) -> Optional[dict]:
+        """Closest-titled stored track by the same primary artist"""
+        title, artist = key.split("|", 1)
+        best: Tuple[float, Optional[dict]] = (SONG_RESOLVER_FUZZY_THRESHOLD, None)
+        cursor = tracks_collection.find(
+            {"search_artists": artist},
+            {**_TRACK_FIELDS, "search_title": 1},
+            limit=SONG_RESOLVER_FUZZY_CANDIDATES,
+        )
+        async for doc in cursor:
+            score = _title_similarity(title, doc.get("search_title", ""))
+            if score >= best[0]:
+                best = (score, doc)
+        return best[1]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "resolved_in_memory": len(self._resolved),
+            "hits": self.hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "recorded": self.recorded,
+        }
+
+
+def _track_item(doc: dict) -> dict:
+    return TrackItem(data=Track(**doc)).model_dump()
+
+
+song_resolver = SongResolver()
@@ -0,0 +1,135 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from fastapi import Response
+
+from core.config import logger
+from services.cache import get_cached_entry, set_cached_entry
+from services.single_flight import SingleFlight
+
+
+@dataclass
+class CacheStatus:
+    state: str  # "fresh", "stale" or "miss"
+    age: int  # seconds since the result was fetched
+
+    def apply(self, response: Optional[Response]):
+        """Expose the result's age and staleness as response headers"""
+        if response is None:
+            return
+        response.headers["Age"] = str(self.age)
+        response.headers["X-Cache"] = self.state
+
+
+class StaleWhileRevalidate:
+    """Serves cached results past their soft TTL while refreshing them.
+
+    Fresh entries are returned directly. Past fresh_ttl the stale entry is
+    returned immediately and a single background refresh is started. Only
+    past ttl (or with nothing cached) does the caller wait for the fetch,
+    and even then a failed fetch falls back to whatever is still stored.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flight = SingleFlight(name)
+        self._background: Set[asyncio.Task] = set()
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    async def get(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        fresh_ttl: timedelta,
+        ttl: timedelta,
+    ) -> Tuple[Any, CacheStatus]:
+        entry = await get_cached_entry(key)
+        now = datetime.now()
+        if entry is not None and now < entry["fresh_until"]:
+            self.fresh_hits += 1
+            return entry["result"], self._status("fresh", entry, now)
+
+        if entry is not None and now < entry["expires_at"]:
+            self.stale_hits += 1
+            self._refresh_in_background(key, fetch, fresh_ttl, ttl)
+            return entry["result"], self._status("stale", entry, now)
+
+        self.misses += 1
+        try:
+            entry = await self._flight.do(
+                key, lambda: self._refresh(key, fetch, fresh_ttl, ttl)
+            )
+        except Exception:
+            if entry is None:
+                raise
+            logger.warning(f"Serving expired {self.name} result for {key}")
+            return entry["result"], self._status("stale", entry, datetime.now())
+        return entry["result"], CacheStatus("miss", 0)
+
+    async def warm(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        fresh_ttl: timedelta,
+        ttl: timedelta,
+        horizon: timedelta,
+        force: bool = False,
+    ) -> bool:
+        """Refresh the entry if forced, missing or turning stale within
+        horizon; returns whether it was refreshed"""
+        entry = None if force else await get_cached_entry(key)
+        if entry is not None and datetime.now() + horizon < entry["fresh_until"]:
+            return False
+        await self._flight.do(key, lambda: self._refresh(key, fetch, fresh_ttl, ttl))
+        return True
+
+    @staticmethod
+    def _status(state: str, entry: Dict[str, Any], now: datetime) -> CacheStatus:
+        created_at = entry.get("created_at")
+        age = int((now - created_at).total_seconds()) if created_at else 0
+        return CacheStatus(state, max(age, 0))
+
+    async def _refresh(self, key, fetch, fresh_ttl, ttl) -> Dict[str, Any]:
+        self.refreshes += 1
+        try:
+            result = await fetch()
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.error(f"Error refreshing {self.name} for {key}: {e}")
+            raise e
+        return await set_cached_entry(key, result, fresh_ttl, ttl)
+
+    def _refresh_in_background(self, key, fetch, fresh_ttl, ttl):
+        if self._flight.is_running(key):
+            return
+        task = asyncio.ensure_future(
+            self._flight.do(key, lambda: self._refresh(key, fetch, fresh_ttl, ttl))
+        )
+        self._background.add(task)
+        # Failures are counted and logged in _refresh; the stale entry stays
+        task.add_done_callback(self._background.discard)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "refreshing": self._flight.in_flight(),
+        }
+
+
+top_tracks_swr = StaleWhileRevalidate("top_tracks")
+popular_songs_swr = StaleWhileRevalidate("popular_songs")
+
+
+def swr_stats() -> Dict[str, Dict[str, int]]:
+    return {swr.name: swr.stats() for swr in (top_tracks_swr, popular_songs_swr)}
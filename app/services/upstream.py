@@ -0,0 +1,106 @@
+import importlib.util
+from enum import Enum
+from typing import Any, Dict, Optional
+
+import httpx
+
+from core.config import (
+    logger,
+    RAPID_API_KEY,
+    RAPID_API_HOST,
+    RAPID_API_DOWNLOAD_HOST,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_READ_TIMEOUT,
+    UPSTREAM_POOL_TIMEOUT,
+    UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+    UPSTREAM_MAX_KEEPALIVE_PER_HOST,
+    UPSTREAM_KEEPALIVE_EXPIRY,
+    UPSTREAM_HTTP2,
+)
+
+# One pooled client per upstream host, so each host gets its own connection limit
+_clients: Dict[str, httpx.AsyncClient] = {}
+# Audio files come from many CDN hosts; they share one pool instead
+_media_client: Optional[httpx.AsyncClient] = None
+_started = False
+
+
+def _http2_available() -> bool:
+    # httpx only negotiates HTTP/2 when the optional h2 package is installed
+    return UPSTREAM_HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=_http2_available(),
+        timeout=httpx.Timeout(
+            UPSTREAM_READ_TIMEOUT,
+            connect=UPSTREAM_CONNECT_TIMEOUT,
+            pool=UPSTREAM_POOL_TIMEOUT,
+        ),
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_client(host: str) -> httpx.AsyncClient:
+    """Return the app-lifetime client for the given RapidAPI host."""
+    client = _clients.get(host)
+    if client is None or client.is_closed:
+        if _started:
+            logger.info(f"Opening upstream connection pool for {host}")
+        else:
+            logger.warning(f"Upstream client for {host} used before startup")
+        client = _build_client()
+        _clients[host] = client
+    return client
+
+
+def get_media_client() -> httpx.AsyncClient:
+    """Return the app-lifetime client for downloading media from CDN hosts."""
+    global _media_client
+    if _media_client is None or _media_client.is_closed:
+        _media_client = _build_client()
+    return _media_client
+
+
+async def rapidapi_get(
+    url: str, host: str, params: Optional[Dict[str, Any]] = None
+) -> Any:
+    """GET a RapidAPI endpoint through the shared pool and return the JSON body"""
+    headers = {
+        "x-rapidapi-key": RAPID_API_KEY,
+        "x-rapidapi-host": host,
+    }
+    if params:
+        # httpx formats str-Enums as "Country.GLOBAL"; send their values
+        params = {
+            key: value.value if isinstance(value, Enum) else value
+            for key, value in params.items()
+        }
+    response = await get_client(host).get(url, headers=headers, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+async def startup():
+    global _started
+    _started = True
+    for host in (RAPID_API_HOST, RAPID_API_DOWNLOAD_HOST):
+        if host:
+            get_client(host)
+    logger.info(f"Upstream HTTP client ready (http2={_http2_available()})")
+
+
+async def shutdown():
+    global _started
+    _started = False
+    for host, client in list(_clients.items()):
+        await client.aclose()
+        logger.info(f"Closed upstream connection pool for {host}")
+    _clients.clear()
+    if _media_client is not None:
+        await _media_client.aclose()
@@ -0,0 +1,630 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import (
+    logger,
+    EMBEDDING_MODEL_TAG,
+    VECTOR_INDEX_PATH,
+    VECTOR_INDEX_NPROBE,
+    VECTOR_INDEX_SYNC_INTERVAL,
+    VECTOR_INDEX_FILTER_FIELDS,
+    EMBEDDING_STORE_DIR,
+    EXACT_SEARCH_MAX_ROWS,
+    EMBEDDING_STORE_COMPACT_RATIO,
+    SIMILARITY_MODE,
+    QUANTIZED_SHORTLIST,
+)
+from db.mongo import tracks_collection
+from services.dedup import is_duplicate
+from services.embedding_codec import decode_embedding
+from services.embedding_store import EmbeddingStore, normalize_vectors
+from services.quantized_index import QuantizedVectors, evaluate_recall
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 20000
+SYNC_BATCH_SIZE = 1000
+
+
+def train_ivf(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over normalized vectors; returns centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=nlist)
+        # Keep the previous centroid for clusters that lost all members
+        filled = counts > 0
+        centroids[filled] = normalize_vectors(sums[filled])
+    return centroids
+
+
+def assign_ivf(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 8192):
+    """Nearest centroid for every vector, in chunks to bound memory"""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = vectors[start : start + chunk]
+        assign[start : start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def _train_and_assign(vectors: np.ndarray, alive: np.ndarray, nlist: int):
+    """Train on a sample of live rows, then assign every row to a list"""
+    live = np.flatnonzero(alive)
+    if len(live) > KMEANS_SAMPLE_SIZE:
+        rng = np.random.default_rng(0)
+        live = np.sort(rng.choice(live, KMEANS_SAMPLE_SIZE, replace=False))
+    centroids = train_ivf(np.asarray(vectors[live]), nlist)
+    return centroids, assign_ivf(vectors[: len(alive)], centroids)
+
+
+class IVFFlatIndex:
+    """IVF-flat partitioning over the rows of an EmbeddingStore.
+
+    Vectors live in the shared memory-mapped store; this index only keeps,
+    per store row, the k-means list it belongs to and codes for a few
+    filterable attributes (e.g. genre). Small catalogs are searched exactly;
+    larger ones score only the rows in the nprobe closest lists. With
+    quantized=True rows are scored from an int8 copy instead of the float32
+    store, and results are approximate.
+    """
+
+    def __init__(
+        self,
+        store: EmbeddingStore,
+        filter_fields: List[str],
+        nprobe: int = 8,
+        quantized: bool = False,
+    ):
+        self.store = store
+        self.filter_fields = list(filter_fields)
+        self.nprobe = nprobe
+        self.quantized = QuantizedVectors(store) if quantized else None
+        self.generation = store.generation
+        self._lists = np.zeros(0, dtype=np.int32)
+        self._attr_codes = {f: np.zeros(0, dtype=np.int32) for f in self.filter_fields}
+        self._attr_vocab: Dict[str, Dict[str, int]] = {
+            f: {} for f in self.filter_fields
+        }
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def reset(self):
+        """Drop per-row state, e.g. after the store was compacted"""
+        self.__init__(
+            self.store, self.filter_fields, self.nprobe, self.quantized is not None
+        )
+
+    def refresh(self):
+        """Pick up the store's changes from disk"""
+        self.store.refresh()
+        self._sync_rows()
+
+    def _sync_rows(self):
+        """Grow per-row arrays to cover rows appended to the store"""
+        if self.generation != self.store.generation:
+            # The store was compacted, possibly by another worker: rows moved
+            self.reset()
+        rows = len(self.store.ids)
+        missing = rows - len(self._lists)
+        if missing <= 0:
+            return
+        new_lists = np.full(missing, -1, np.int32)
+        if self.centroids is not None:
+            new_lists = assign_ivf(
+                self.store.matrix[len(self._lists) :], self.centroids
+            )
+        self._lists = np.concatenate([self._lists, new_lists])
+        if self.quantized is not None:
+            self.quantized.extend(self.store.matrix[len(self.quantized) : rows])
+        for field in self.filter_fields:
+            self._attr_codes[field] = np.concatenate(
+                [self._attr_codes[field], np.full(missing, -1, np.int32)]
+            )
+
+    def _attr_code(self, field: str, value: Any) -> int:
+        if value is None:
+            return -1
+        vocab = self._attr_vocab[field]
+        return vocab.setdefault(str(value), len(vocab))
+
+    def upsert_many(self, docs: List[Dict[str, Any]]):
+        """Add or update track documents carrying _id, embedding and attributes.
+
+        Only canonical tracks are indexed; duplicates found by the
+        de-duplication job are removed instead.
+        """
+        duplicates = [doc["_id"] for doc in docs if is_duplicate(doc)]
+        if duplicates:
+            self.store.remove_many(duplicates)
+            docs = [doc for doc in docs if not is_duplicate(doc)]
+        rows = self.store.upsert_many(
+            [(doc["_id"], decode_embedding(doc["embedding"])) for doc in docs]
+        )
+        self._sync_rows()
+        for doc, row in zip(docs, rows):
+            if row < 0:
+                continue
+            for field in self.filter_fields:
+                self._attr_codes[field][row] = self._attr_code(field, doc.get(field))
+
+    def remove_many(self, ids: List[str]):
+        self.store.remove_many(ids)
+
+    def vector(self, id: str) -> Optional[np.ndarray]:
+        return self.store.vector(id)
+
+    def needs_training(self) -> bool:
+        size = len(self)
+        return size > EXACT_SEARCH_MAX_ROWS and size >= 2 * self.trained_size
+
+    def training_snapshot(self) -> Tuple[np.ndarray, np.ndarray, int]:
+        """The mapped matrix, a copy of the live mask and the generation they
+        belong to, for training off the loop"""
+        return self.store.matrix, self.store.alive.copy(), self.generation
+
+    def apply_training(
+        self,
+        centroids: np.ndarray,
+        assign: np.ndarray,
+        trained_size: int,
+        generation: int,
+    ):
+        if generation != self.generation:
+            # Trained on rows of a store generation that is gone
+            return
+        self.centroids = centroids
+        self.trained_size = trained_size
+        self._lists[: len(assign)] = assign
+        # Rows appended while training ran are assigned here
+        if len(self._lists) > len(assign):
+            self._lists[len(assign) :] = assign_ivf(
+                self.store.matrix[len(assign) : len(self._lists)], centroids
+            )
+
+    def search(
+        self,
+        vector,
+        k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        exclude: Iterable[str] = (),
+    ) -> List[Tuple[str, float]]:
+        """Top-k (id, cosine similarity) pairs, best first"""
+        self._sync_rows()
+        size = len(self._lists)
+        if size == 0:
+            return []
+        mask = self._filter_mask(filters, exclude)
+        if not mask.any():
+            return []
+
+        if self.centroids is None or len(self) <= EXACT_SEARCH_MAX_ROWS:
+            return self._rank(vector, k, mask=mask)
+
+        query = normalize_vectors(np.asarray(vector, dtype=np.float32))
+        nprobe = min(self.nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        probed = mask & (np.isin(self._lists, probe) | (self._lists == -1))
+        probed &= self.store.alive[:size]
+        # Selective filters can leave too few rows in the probed lists
+        if probed.sum() < k:
+            return self._rank(vector, k, mask=mask)
+        return self._rank(vector, k, rows=np.flatnonzero(probed))
+
+    def search_many(
+        self,
+        vectors,
+        k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        exclude: Iterable[str] = (),
+    ) -> List[List[Tuple[str, float]]]:
+        """Top-k for several query vectors, with the filter mask built once.
+
+        Scores the whole (filtered) store with one matrix product per chunk,
+        which beats per-query IVF probing for batches of seeds.
+        """
+        self._sync_rows()
+        if len(self._lists) == 0:
+            return [[] for _ in vectors]
+        mask = self._filter_mask(filters, exclude)
+        if not mask.any():
+            return [[] for _ in vectors]
+        return self.store.search_many(np.stack(vectors), k, mask=mask)
+
+    def _filter_mask(
+        self, filters: Optional[Dict[str, Any]], exclude: Iterable[str]
+    ) -> np.ndarray:
+        mask = np.ones(len(self._lists), dtype=bool)
+        for field, value in (filters or {}).items():
+            if field not in self._attr_codes:
+                raise KeyError(f"Field {field} is not indexed for filtering")
+            code = self._attr_vocab[field].get(str(value))
+            if code is None:
+                return np.zeros(len(self._lists), dtype=bool)
+            mask &= self._attr_codes[field] == code
+        for id in exclude:
+            row = self.store.rows.get(id)
+            if row is not None:
+                mask[row] = False
+        return mask
+
+    def _rank(self, vector, k: int, **kwargs) -> List[Tuple[str, float]]:
+        scorer = self.quantized if self.quantized is not None else self.store
+        return scorer.search(vector, k, **kwargs)
+
+    def save(self, path: str, meta: Dict[str, Any]):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                lists=self._lists,
+                centroids=(
+                    self.centroids
+                    if self.centroids is not None
+                    else np.zeros((0, self.store.dim or 0), np.float32)
+                ),
+                attr_codes=(
+                    np.stack([self._attr_codes[f] for f in self.filter_fields])
+                    if self.filter_fields
+                    else np.zeros((0, len(self._lists)), np.int32)
+                ),
+                meta=np.array(
+                    json.dumps(
+                        {
+                            **meta,
+                            "generation": self.generation,
+                            "trained_size": self.trained_size,
+                            "filter_fields": self.filter_fields,
+                            "attr_vocab": self._attr_vocab,
+                        },
+                        default=str,
+                    )
+                ),
+            )
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> Dict[str, Any]:
+        """Restore per-row state saved for the store's current generation"""
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if (
+                meta.get("generation") != self.store.generation
+                or meta.get("filter_fields") != self.filter_fields
+            ):
+                raise ValueError("index was saved for another store generation")
+            rows = min(len(data["lists"]), len(self.store.ids))
+            self._lists = data["lists"][:rows].astype(np.int32)
+            centroids = data["centroids"]
+            self.centroids = centroids if len(centroids) else None
+            self.trained_size = meta["trained_size"]
+            for i, field in enumerate(self.filter_fields):
+                self._attr_codes[field] = data["attr_codes"][i][:rows].astype(np.int32)
+            self._attr_vocab = meta["attr_vocab"]
+        self._sync_rows()
+        return meta
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self),
+            "nlist": len(self.centroids) if self.centroids is not None else 0,
+            "nprobe": self.nprobe,
+            "trained_size": self.trained_size,
+            "exact_search": self.centroids is None
+            or len(self) <= EXACT_SEARCH_MAX_ROWS,
+            "store": self.store.stats(),
+            "quantized": self.quantized.stats() if self.quantized is not None else None,
+        }
+
+
+class VectorIndexService:
+    """Keeps the embedding store and its IVF index in sync with tracks_collection.
+
+    At startup the store is mapped from disk, the saved index state is
+    restored and caught up with tracks updated since it was saved. After that
+    the service polls for tracks embedded by other workers. Tracks embedded
+    by this worker are inserted directly.
+
+    Store and index work (file locks, appends, remapping the matrix and
+    searches) runs on one dedicated thread: off the event loop, and one call
+    at a time, so a search never sees a half-applied update.
+    """
+
+    def __init__(self, path: str, store_dir: str):
+        self.path = path
+        self.store = EmbeddingStore(store_dir, EMBEDDING_MODEL_TAG)
+        self.index = IVFFlatIndex(
+            self.store,
+            VECTOR_INDEX_FILTER_FIELDS,
+            VECTOR_INDEX_NPROBE,
+            quantized=SIMILARITY_MODE == "int8",
+        )
+        self.ready = False
+        self.synced_until: Optional[datetime] = None
+        # Store generation the index held at the last sync
+        self.synced_generation: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._training = False
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.last_sync_seconds = 0.0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    async def start(self):
+        await self._run(self._open)
+        self._task = asyncio.ensure_future(self._sync_loop())
+
+    def _open(self):
+        self.store.open()
+        if self.store.tombstoned_ratio() > EMBEDDING_STORE_COMPACT_RATIO:
+            self.store.compact()
+        self.index.reset()
+        if os.path.exists(self.path):
+            try:
+                meta = self.index.load(self.path)
+                if meta.get("model") == EMBEDDING_MODEL_TAG and meta.get(
+                    "synced_until"
+                ):
+                    self.synced_until = datetime.fromisoformat(meta["synced_until"])
+                logger.info(f"Loaded vector index with {len(self.index)} tracks")
+            except Exception as e:
+                logger.info(f"Rebuilding vector index ({e})")
+                self.index.reset()
+        self.synced_generation = self.index.generation
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.ready:
+            await self._run(self.save)
+
+    def save(self):
+        self.index.save(
+            self.path,
+            {
+                "model": EMBEDDING_MODEL_TAG,
+                "synced_until": (
+                    self.synced_until.isoformat() if self.synced_until else None
+                ),
+            },
+        )
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                await self.sync()
+                if not self.ready:
+                    self.ready = True
+                    await self._run(self.save)
+            except Exception as e:
+                logger.error(f"Error syncing vector index: {e}")
+            await asyncio.sleep(VECTOR_INDEX_SYNC_INTERVAL)
+
+    async def sync(self):
+        """Pull tracks embedded since the last sync into the store and index"""
+        started = time.perf_counter()
+        if await self._run(self._refresh):
+            # Another worker compacted the store: rows moved, resync everything
+            self.synced_until = None
+
+        query = {"embedding_model": EMBEDDING_MODEL_TAG}
+        if self.synced_until is not None:
+            query["updated_at"] = {"$gte": self.synced_until}
+        projection = {"embedding": 1, "updated_at": 1, "canonical_id": 1}
+        for field in VECTOR_INDEX_FILTER_FIELDS:
+            projection[field] = 1
+
+        count = 0
+        batch = []
+        async for doc in tracks_collection.find(query, projection):
+            if "embedding" not in doc:
+                continue
+            batch.append(doc)
+            updated_at = doc.get("updated_at")
+            if updated_at and (
+                self.synced_until is None or updated_at > self.synced_until
+            ):
+                self.synced_until = updated_at
+            if len(batch) >= SYNC_BATCH_SIZE:
+                await self._run(self.index.upsert_many, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            await self._run(self.index.upsert_many, batch)
+            count += len(batch)
+        self.last_sync_seconds = time.perf_counter() - started
+        if count:
+            logger.info(f"Synced {count} tracks into the vector index")
+        await self._maybe_train()
+
+    def _refresh(self) -> bool:
+        """Pick up the store's changes; True if the index was reset since the
+        last sync, here or by an upsert that found the store compacted"""
+        self.index.refresh()
+        reset = self.index.generation != self.synced_generation
+        self.synced_generation = self.index.generation
+        return reset
+
+    async def _maybe_train(self):
+        if self._training or not self.index.needs_training():
+            return
+        self._training = True
+        try:
+            vectors, alive, generation = await self._run(self.index.training_snapshot)
+            trained_size = int(alive.sum())
+            nlist = int(min(4096, max(16, np.sqrt(trained_size))))
+            loop = asyncio.get_running_loop()
+            centroids, assign = await loop.run_in_executor(
+                None, _train_and_assign, vectors, alive, nlist
+            )
+            await self._run(
+                self.index.apply_training, centroids, assign, trained_size, generation
+            )
+            logger.info(
+                f"Trained vector index: {nlist} lists over {trained_size} tracks"
+            )
+        finally:
+            self._training = False
+
+    async def upsert_many(self, tracks: List[Dict[str, Any]]):
+        """Insert freshly embedded track documents (must carry _id and embedding)"""
+        if self.ready:
+            await self._run(self.index.upsert_many, tracks)
+
+    async def search(
+        self, song_id: str, n: int, filter_criteria: Optional[Dict[str, Any]] = None
+    ) -> Optional[List[Tuple[str, float]]]:
+        """Similar (id, score) pairs, or None if the index cannot answer"""
+        if not self.ready:
+            return None
+        exclude = [song_id]
+        vector = await self._run(self.index.vector, song_id)
+        if vector is None:
+            source = await tracks_collection.find_one(
+                {"_id": song_id, "embedding_model": EMBEDDING_MODEL_TAG},
+                {"embedding": 1, "canonical_id": 1},
+            )
+            if not source or "embedding" not in source:
+                return []
+            vector = decode_embedding(source["embedding"])
+            # A duplicate's own canonical track is the same recording
+            exclude.append(source.get("canonical_id", song_id))
+        # In int8 mode the index returns a shortlist that is re-ranked below
+        k = n if self.index.quantized is None else max(QUANTIZED_SHORTLIST, n)
+        try:
+            hits = await self._run(
+                self.index.search, vector, k, filter_criteria, exclude
+            )
+        except KeyError as e:
+            logger.info(f"Vector index cannot serve filter: {e}")
+            return None
+        if self.index.quantized is None:
+            return hits
+        return await self._rerank(vector, hits, n)
+
+    async def search_many(
+        self,
+        song_ids: List[str],
+        n: int,
+        filter_criteria: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, List[Tuple[str, float]]]]:
+        """Similar (id, score) pairs per seed, excluding all seeds, or None if
+        the index cannot answer. Seeds without an embedding are left out."""
+        if not self.ready:
+            return None
+        vectors = await self._run(self._vectors, song_ids)
+        missing = [id for id in song_ids if id not in vectors]
+        exclude = list(song_ids)
+        if missing:
+            cursor = tracks_collection.find(
+                {"_id": {"$in": missing}, "embedding_model": EMBEDDING_MODEL_TAG},
+                {"embedding": 1, "canonical_id": 1},
+            )
+            async for doc in cursor:
+                if "embedding" in doc:
+                    vectors[doc["_id"]] = decode_embedding(doc["embedding"])
+                    exclude.append(doc.get("canonical_id", doc["_id"]))
+        seeds = [id for id in dict.fromkeys(song_ids) if id in vectors]
+        if not seeds:
+            return {}
+        try:
+            hits = await self._run(
+                self.index.search_many,
+                [vectors[id] for id in seeds],
+                n,
+                filter_criteria,
+                exclude,
+            )
+        except KeyError as e:
+            logger.info(f"Vector index cannot serve filter: {e}")
+            return None
+        return dict(zip(seeds, hits))
+
+    def _vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        vectors = {}
+        for id in ids:
+            vector = self.index.vector(id)
+            if vector is not None:
+                vectors[id] = vector
+        return vectors
+
+    async def _rerank(self, vector, hits: List[Tuple[str, float]], n: int):
+        """Re-score a quantized shortlist with the full-precision embeddings
+        stored in tracks_collection"""
+        if not hits:
+            return []
+        cursor = tracks_collection.find(
+            {
+                "_id": {"$in": [id for id, _ in hits]},
+                "embedding_model": EMBEDDING_MODEL_TAG,
+            },
+            {"embedding": 1},
+        )
+        ids = []
+        vectors = []
+        async for doc in cursor:
+            if "embedding" in doc:
+                ids.append(doc["_id"])
+                vectors.append(decode_embedding(doc["embedding"]))
+        if not vectors:
+            return []
+        query = normalize_vectors(np.asarray(vector, dtype=np.float32))
+        scores = normalize_vectors(np.stack(vectors).astype(np.float32)) @ query
+        top = np.argsort(-scores)[:n]
+        return [(ids[i], float(scores[i])) for i in top]
+
+    async def evaluate_recall(
+        self, k: int, shortlists: List[int], samples: int
+    ) -> Optional[Dict[str, Any]]:
+        """recall@k of the int8 mode against exact search, for choosing
+        QUANTIZED_SHORTLIST; works whichever SIMILARITY_MODE is active"""
+        if not self.ready:
+            return None
+        quantized = self.index.quantized
+        loop = asyncio.get_running_loop()
+        if quantized is None:
+            quantized = QuantizedVectors(self.store)
+            await loop.run_in_executor(
+                self._executor,
+                quantized.extend,
+                self.store.matrix[: len(self.store.ids)],
+            )
+        return await loop.run_in_executor(
+            self._executor,
+            evaluate_recall,
+            self.store,
+            quantized,
+            k,
+            shortlists,
+            samples,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.index.stats(),
+            "ready": self.ready,
+            "similarity_mode": SIMILARITY_MODE,
+            "synced_until": (
+                self.synced_until.isoformat() if self.synced_until else None
+            ),
+            "last_sync_seconds": round(self.last_sync_seconds, 4),
+        }
+
+
+vector_index = VectorIndexService(VECTOR_INDEX_PATH, EMBEDDING_STORE_DIR)
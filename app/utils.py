@@ -1,48 +1,77 @@
-import librosa
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-from app.models.tracks import Track, TrackItem
+from app.models.tracks import Track
+from core.config import (
+    logger,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_MODEL_TAG,
+    EMBEDDING_CACHE_SIZE,
+)
+from services.audio_features import audio_pipeline
 
-# Initialize text embedding model
-text_model = SentenceTransformer("all-MiniLM-L6-v2")
+# The text embedding model (and torch behind it) is loaded on first use or by
+# the lifespan warm-up, so importing this module stays cheap
+_text_model = None
+_text_model_lock = threading.Lock()
 
 
-def extract_audio_features(audio_path):
-    """Extract key audio features using librosa"""
-    # Load audio file
-    y, sr = librosa.load(audio_path)
+def get_text_model():
+    """Return the text embedding model, loading it on first call"""
+    global _text_model
+    if _text_model is None:
+        with _text_model_lock:
+            if _text_model is None:
+                from sentence_transformers import SentenceTransformer
 
-    # Extract features
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-    spectral_contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
+                started = time.perf_counter()
+                _text_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+                logger.info(
+                    f"Loaded embedding model {EMBEDDING_MODEL_NAME} in "
+                    f"{time.perf_counter() - started:.2f}s"
+                )
+    return _text_model
 
-    # Aggregate features (mean across time)
-    features = np.hstack(
-        [
-            np.mean(mfcc, axis=1),
-            np.mean(chroma, axis=1),
-            np.mean(spectral_contrast, axis=1),
-            [tempo / 200.0],  # Normalize tempo
-        ]
-    )
 
-    return features
+def is_text_model_loaded() -> bool:
+    return _text_model is not None
+
+
+# Normalized text embeddings keyed by hash of the input text, for repeats
+# within a burst. Guarded by a lock since the ingest workers are threads.
+_embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+_embedding_cache_stats = {"hits": 0, "misses": 0}
+
+
+def create_metadata_text(song_metadata: Track) -> str:
+    """Combine the metadata fields that feed the text embedding"""
+    return f"{song_metadata.name} {song_metadata.artists.items[0].profile.name} {song_metadata.albumOfTrack.name}"
 
 
 def create_metadata_embedding(song_metadata: Track):
     """Create text embeddings from song metadata"""
     # Combine relevant metadata
-    text = f"{song_metadata.name} {song_metadata.artists.items[0].profile.name} {song_metadata.albumOfTrack.name}"
-    # Create embedding
-    embedding = text_model.encode(text)
+    text = create_metadata_text(song_metadata)
+    # Create embedding (served from the text-hash cache for repeats)
+    embedding = encode_metadata_texts([text])[0]
     return embedding
 
 
 def create_hybrid_embedding(song_metadata: Track, audio_path: str = None):
     """Create a combined embedding using both audio and metadata"""
+    # Identical audio with identical metadata text was embedded before
+    if audio_path:
+        text_hash = embedding_text_hash(create_metadata_text(song_metadata))
+        cached = audio_pipeline.cached_embedding(audio_path, text_hash)
+        if cached is not None:
+            return cached.tolist()
+
     # Get metadata embedding
     metadata_embedding = create_metadata_embedding(song_metadata)
     metadata_embedding_normalized = metadata_embedding / np.linalg.norm(
@@ -51,7 +80,8 @@ def create_hybrid_embedding(song_metadata: Track, audio_path: str = None):
 
     # If audio path is provided, include audio features
     if audio_path:
-        audio_features = extract_audio_features(audio_path)
+        # Reuses features stored for this audio instead of re-decoding
+        audio_features = audio_pipeline.features_for(audio_path)
         audio_features_normalized = audio_features / np.linalg.norm(audio_features)
 
         # Dimensionality reduction might be needed if dimensions differ significantly
@@ -62,9 +92,68 @@ def create_hybrid_embedding(song_metadata: Track, audio_path: str = None):
                 metadata_embedding_normalized * 0.6,  # 60% weight to metadata
             ]
         )
+        audio_pipeline.save_embedding(audio_path, text_hash, hybrid_embedding)
     else:
         # Fall back to just metadata if no audio
         hybrid_embedding = metadata_embedding_normalized
 
     # Return as a regular Python list for MongoDB compatibility
     return hybrid_embedding.tolist()
+
+
+def embedding_text_hash(text: str) -> str:
+    """Hash of the embedding input text, tagged with the model that embeds it"""
+    return hashlib.sha1(f"{EMBEDDING_MODEL_TAG}\n{text}".encode("utf-8")).hexdigest()
+
+
+def encode_metadata_texts(texts: List[str]) -> np.ndarray:
+    """Normalized text embeddings, encoding only texts missing from the cache"""
+    hashes = [embedding_text_hash(text) for text in texts]
+
+    embeddings: Dict[str, np.ndarray] = {}
+    with _embedding_cache_lock:
+        for text_hash in hashes:
+            cached = _embedding_cache.get(text_hash)
+            if cached is not None:
+                _embedding_cache.move_to_end(text_hash)
+                embeddings[text_hash] = cached
+                _embedding_cache_stats["hits"] += 1
+
+    # Encode the remaining texts in one batch, once each
+    missing = {}
+    for text, text_hash in zip(texts, hashes):
+        if text_hash not in embeddings:
+            missing[text_hash] = text
+    if missing:
+        encoded = get_text_model().encode(
+            list(missing.values()), batch_size=len(missing)
+        )
+        encoded = encoded / np.linalg.norm(encoded, axis=1, keepdims=True)
+        with _embedding_cache_lock:
+            _embedding_cache_stats["misses"] += len(missing)
+            for text_hash, embedding in zip(missing, encoded):
+                embeddings[text_hash] = embedding
+                _embedding_cache[text_hash] = embedding
+                _embedding_cache.move_to_end(text_hash)
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+
+    return np.array([embeddings[text_hash] for text_hash in hashes])
+
+
+def create_hybrid_embeddings(songs_metadata: List[Track]) -> List[list]:
+    """Metadata-only hybrid embeddings for many songs in one batched forward pass"""
+    if not songs_metadata:
+        return []
+    texts = [create_metadata_text(song) for song in songs_metadata]
+    return encode_metadata_texts(texts).tolist()
+
+
+def embedding_cache_stats() -> Dict[str, int]:
+    with _embedding_cache_lock:
+        return {
+            "size": len(_embedding_cache),
+            "max_entries": EMBEDDING_CACHE_SIZE,
+            "model": EMBEDDING_MODEL_TAG,
+            **_embedding_cache_stats,
+        }
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""Find duplicate recordings in the track catalog by chroma fingerprint.
+
+Audio files are named after their track id, as for extract_audio_features.py.
+Each track gets a canonical_id in tracks_collection; the vector index keeps
+only canonical tracks, so duplicates drop out of similar-songs results on
+its next sync.
+
+    python scripts/dedup_tracks.py /data/audio
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+APP_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"
+)
+sys.path[:0] = [APP_DIR, os.path.dirname(APP_DIR)]
+
+from services.audio_features import audio_pipeline  # noqa: E402
+from services.dedup import deduplicate_tracks  # noqa: E402
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".flac", ".ogg", ".m4a"}
+
+
+async def run(directory: str):
+    audio_paths = {}
+    for name in sorted(os.listdir(directory)):
+        track_id, extension = os.path.splitext(name)
+        if extension.lower() in AUDIO_EXTENSIONS:
+            audio_paths[track_id] = os.path.join(directory, name)
+    try:
+        stats = await deduplicate_tracks(audio_paths)
+    finally:
+        audio_pipeline.stop()
+    print(
+        f"{stats['fingerprinted']} of {stats['tracks']} tracks fingerprinted: "
+        f"{stats['clusters']} duplicate clusters, {stats['duplicates']} duplicates, "
+        f"{stats['changed']} tracks updated"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory")
+    args = parser.parse_args()
+    asyncio.run(run(args.directory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Report per-module import cost of the API for cold-start benchmarks.
+
+Runs ``python -X importtime -c "import main"`` from the app directory and
+prints the most expensive top-level packages by cumulative import time.
+
+    python scripts/import_report.py --top 20 --budget-ms 1500
+
+Exits with status 1 when the total import time exceeds --budget-ms, so CI
+can flag cold-start regressions.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+APP_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"
+)
+
+
+def measure(module: str):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [APP_DIR, os.path.dirname(APP_DIR), env.get("PYTHONPATH", "")]
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"Importing {module} failed")
+
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    packages = defaultdict(int)
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = len(name) - len(name.lstrip())
+        name = name.strip()
+        packages[name.split(".")[0]] += int(self_us)
+        if depth == 1:
+            total_us += int(cumulative_us)
+    return total_us, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--json", action="store_true", help="machine readable output")
+    args = parser.parse_args()
+
+    total_us, packages = measure(args.module)
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[
+        : args.top
+    ]
+
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "module": args.module,
+                    "total_ms": total_us / 1000,
+                    "packages_ms": {name: us / 1000 for name, us in ranked},
+                }
+            )
+        )
+    else:
+        print(f"Importing {args.module}: {total_us / 1000:.1f} ms total")
+        for name, us in ranked:
+            print(f"  {us / 1000:10.1f} ms  {name}")
+
+    if args.budget_ms is not None and total_us / 1000 > args.budget_ms:
+        print(f"Import time exceeds budget of {args.budget_ms} ms", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Convert track embeddings in tracks_collection to another storage format.
+
+Rewrites every stored embedding as a BSON array ("array", the format Atlas
+$vectorSearch needs) or as packed "float32" / "float16" binary. Readers
+accept both formats, so the migration can run while the API is serving.
+
+    python scripts/migrate_embeddings.py --to float16 --batch-size 500
+
+Use --dry-run to only count the documents that would change.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+APP_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"
+)
+sys.path[:0] = [APP_DIR, os.path.dirname(APP_DIR)]
+
+from pymongo import UpdateOne  # noqa: E402
+
+from db.mongo import tracks_collection  # noqa: E402
+from services.embedding_codec import (  # noqa: E402
+    STORAGE_FORMATS,
+    decode_embedding,
+    embedding_format,
+    encode_embedding,
+)
+
+
+async def migrate(target: str, batch_size: int, dry_run: bool):
+    scanned = 0
+    converted = 0
+    saved_bytes = 0
+    operations = []
+    cursor = tracks_collection.find(
+        {"embedding": {"$exists": True}}, {"embedding": 1}, batch_size=batch_size
+    )
+    async for doc in cursor:
+        scanned += 1
+        stored = doc["embedding"]
+        if embedding_format(stored) == target:
+            continue
+        encoded = encode_embedding(decode_embedding(stored), target)
+        saved_bytes += _stored_size(stored) - _stored_size(encoded)
+        converted += 1
+        if not dry_run:
+            operations.append(
+                UpdateOne({"_id": doc["_id"]}, {"$set": {"embedding": encoded}})
+            )
+        if len(operations) >= batch_size:
+            await tracks_collection.bulk_write(operations, ordered=False)
+            operations = []
+            print(f"Converted {converted} of {scanned} scanned")
+    if operations:
+        await tracks_collection.bulk_write(operations, ordered=False)
+
+    action = "Would convert" if dry_run else "Converted"
+    print(
+        f"{action} {converted} of {scanned} embeddings to {target} "
+        f"(~{saved_bytes / 1024 / 1024:.1f} MiB smaller)"
+    )
+
+
+def _stored_size(value) -> int:
+    """Approximate BSON size of an embedding value"""
+    if isinstance(value, list):
+        # Each element: type byte, index key and its NUL, 8-byte double
+        return sum(2 + len(str(i)) + 8 for i in range(len(value))) + 5
+    return len(value) + 5
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--to", choices=STORAGE_FORMATS, required=True)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.to, args.batch_size, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
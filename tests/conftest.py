@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app runs from app/ and also imports itself as the app package
+sys.path[:0] = [os.path.join(ROOT, "app"), ROOT]
+
+# The Mongo client connects lazily; tests never reach a server
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/test")
+os.environ.setdefault("MONGO_DB", "test")
@@ -0,0 +1,127 @@
+import asyncio
+import os
+
+import pytest
+
+from services.audio_stream_cache import AudioFill, AudioStreamCache, parse_range
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=900-5000", (900, 999)),
+        # Ignored: the whole file is sent
+        ("bytes=500-100", None),
+        ("bytes=0-1,5-9", None),
+        ("items=0-9", None),
+        ("bytes=a-b", None),
+        ("bytes=-", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5000-6000", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_parse_range_unknown_size():
+    assert parse_range("bytes=0-99", None) is None
+
+
+async def _collect(stream):
+    return b"".join([chunk async for chunk in stream])
+
+
+def test_fill_readers_follow_the_download(tmp_path):
+    async def run():
+        fill = AudioFill("track", str(tmp_path / "track.part"))
+        with open(fill.path, "wb") as f:
+            f.write(b"abc")
+        await fill.advance(3)
+        whole = asyncio.ensure_future(_collect(fill.read()))
+        ranged = asyncio.ensure_future(_collect(fill.read(2, 4)))
+        await asyncio.sleep(0)
+        with open(fill.path, "ab") as f:
+            f.write(b"defg")
+        await fill.advance(4, done=True)
+        return await whole, await ranged
+
+    assert asyncio.run(run()) == (b"abcdefg", b"cde")
+
+
+def test_fill_failure_reaches_started_readers(tmp_path):
+    async def run():
+        fill = AudioFill("track", str(tmp_path / "track.part"))
+        with open(fill.path, "wb") as f:
+            f.write(b"abc")
+        await fill.advance(3)
+        stream = fill.read()
+        first = await stream.__anext__()
+        # The failed fill deletes its partial file while the reader waits
+        os.remove(fill.path)
+        await fill.advance(error=IOError("upstream reset"))
+        with pytest.raises(IOError, match="upstream reset"):
+            await stream.__anext__()
+        return first
+
+    assert asyncio.run(run()) == b"abc"
+
+
+def test_read_survives_unlink_after_open(tmp_path):
+    async def run():
+        fill = AudioFill("track", str(tmp_path / "track.part"))
+        with open(fill.path, "wb") as f:
+            f.write(b"abcdef")
+        await fill.advance(6, done=True)
+        stream = fill.read(1)
+        os.remove(fill.path)
+        return await _collect(stream)
+
+    assert asyncio.run(run()) == b"bcdef"
+
+
+def _put(cache: AudioStreamCache, digest: str, size: int, extension=".mp3"):
+    name = f"{digest}{extension}"
+    with open(os.path.join(cache.directory, name), "wb") as f:
+        f.write(b"x" * size)
+    cache._add(digest, name, size)
+
+
+def test_eviction_keeps_the_budget(tmp_path):
+    cache = AudioStreamCache(str(tmp_path), max_bytes=250)
+    _put(cache, "a", 100)
+    _put(cache, "b", 100)
+    assert cache._cached("a") is not None  # a is now most recently used
+    _put(cache, "c", 100)
+    assert cache.bytes == 200
+    assert cache.evictions == 1
+    assert sorted(os.listdir(tmp_path)) == ["a.mp3", "c.mp3"]
+
+
+def test_refill_replaces_the_entry(tmp_path):
+    cache = AudioStreamCache(str(tmp_path), max_bytes=250)
+    _put(cache, "a", 100)
+    _put(cache, "b", 100)
+    _put(cache, "a", 120)
+    _put(cache, "a", 80, extension=".m4a")
+    assert cache.bytes == 180
+    assert cache.evictions == 0
+    assert sorted(os.listdir(tmp_path)) == ["a.m4a", "b.mp3"]
+
+
+def test_files_of_other_workers_are_found(tmp_path):
+    cache = AudioStreamCache(str(tmp_path), max_bytes=1000)
+    with open(tmp_path / "d.mp3", "wb") as f:
+        f.write(b"x" * 10)
+    cached = cache._cached("d")
+    assert cached.size == 10 and cached.content_type == "audio/mpeg"
+    assert cache.bytes == 10
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from services.dedup import find_duplicate_clusters
+
+BITS = 288
+MAX_HAMMING = 24
+DURATION = 200_000
+
+
+def _flip(fingerprint: bytes, count: int) -> bytes:
+    """The fingerprint with count bits flipped, spread over its whole length
+    so that as many bands as possible differ"""
+    bits = np.unpackbits(np.frombuffer(fingerprint, dtype=np.uint8))
+    positions = np.linspace(0, BITS - 1, count).astype(int)
+    bits[positions] ^= 1
+    return np.packbits(bits).tobytes()
+
+
+@pytest.fixture
+def catalog():
+    """Unrelated tracks around the pair under test"""
+    rng = np.random.default_rng(3)
+    fingerprints = {
+        f"other{i}": np.packbits(rng.integers(0, 2, BITS)).tobytes() for i in range(200)
+    }
+    durations = {id: DURATION for id in fingerprints}
+    original = np.packbits(rng.integers(0, 2, BITS)).tobytes()
+    fingerprints["a"] = original
+    durations["a"] = durations["b"] = DURATION
+    return fingerprints, durations
+
+
+def test_pair_at_the_threshold_is_found(catalog):
+    fingerprints, durations = catalog
+    fingerprints["b"] = _flip(fingerprints["a"], MAX_HAMMING)
+    clusters = find_duplicate_clusters(fingerprints, durations, max_hamming=MAX_HAMMING)
+    assert [sorted(cluster) for cluster in clusters] == [["a", "b"]]
+
+
+def test_pair_just_over_the_threshold_is_not(catalog):
+    fingerprints, durations = catalog
+    fingerprints["b"] = _flip(fingerprints["a"], MAX_HAMMING + 1)
+    assert (
+        find_duplicate_clusters(
+            fingerprints, durations, bands=MAX_HAMMING + 2, max_hamming=MAX_HAMMING
+        )
+        == []
+    )
+
+
+def test_durations_must_agree(catalog):
+    fingerprints, durations = catalog
+    fingerprints["b"] = fingerprints["a"]
+    durations["b"] = DURATION + 30_000
+    assert find_duplicate_clusters(fingerprints, durations) == []
+    del durations["b"]
+    assert find_duplicate_clusters(fingerprints, durations) == []
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from services.embedding_store import EmbeddingStore
+from services.vector_index import IVFFlatIndex
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path)
+
+
+def _store(directory: str, model: str = "model") -> EmbeddingStore:
+    store = EmbeddingStore(directory, model)
+    store.open()
+    return store
+
+
+def _append(store: EmbeddingStore, name: str, data: bytes):
+    with open(store._gen_path(name), "ab") as f:
+        f.write(data)
+
+
+def test_upsert_keeps_identical_rows(directory):
+    store = _store(directory)
+    assert store.upsert_many([("a", [1, 0, 0]), ("b", [0, 2, 0])]) == [0, 1]
+    assert store.upsert_many([("a", [2, 0, 0])]) == [0]
+    assert store.upsert_many([("b", [0, 0, 1])]) == [2]
+    assert len(store) == 2
+    assert store.search([0, 0, 1], 1)[0][0] == "b"
+    np.testing.assert_allclose(store.vector("b"), [0, 0, 1])
+
+
+def test_tombstones_reach_other_workers(directory):
+    store = _store(directory)
+    other = _store(directory)
+    store.upsert_many([("a", [1, 0, 0]), ("b", [0, 1, 0])])
+    store.remove_many(["a"])
+    assert other.refresh()
+    assert other.vector("a") is None
+    assert [id for id, _ in other.search([1, 0, 0], 2)] == ["b"]
+    assert other.tombstoned_ratio() == 0.5
+
+
+def test_open_repairs_a_torn_append(directory):
+    store = _store(directory)
+    store.upsert_many([("a", [1, 0, 0]), ("b", [0, 1, 0])])
+    # A writer died after its vectors and part of its id line
+    _append(store, "vectors", np.ones(3, np.float32).tobytes() + b"\x00")
+    _append(store, "ids", b"c")
+    _append(store, "tombstones", b"1")
+
+    reopened = _store(directory)
+    assert reopened.ids == ["a", "b"]
+    assert reopened.matrix.shape == (2, 3)
+    assert len(reopened) == 2
+    reopened.upsert_many([("d", [0, 0, 1])])
+    assert _store(directory).ids == ["a", "b", "d"]
+    np.testing.assert_allclose(_store(directory).vector("d"), [0, 0, 1])
+
+
+def test_open_drops_ids_without_rows(directory):
+    store = _store(directory)
+    store.upsert_many([("a", [1, 0, 0]), ("b", [0, 1, 0]), ("c", [0, 0, 1])])
+    with open(store._gen_path("vectors"), "r+b") as f:
+        f.truncate(2 * 3 * 4)
+
+    reopened = _store(directory)
+    assert reopened.ids == ["a", "b"]
+    assert reopened.vector("c") is None
+
+
+def test_append_cuts_rows_left_by_a_dead_writer(directory):
+    store = _store(directory)
+    store.upsert_many([("a", [1, 0, 0])])
+    _append(store, "vectors", np.ones(3, np.float32).tobytes())
+    assert store.upsert_many([("b", [0, 1, 0])]) == [1]
+    np.testing.assert_allclose(_store(directory).vector("b"), [0, 1, 0])
+
+
+def test_compact_moves_live_rows_to_a_new_generation(directory):
+    store = _store(directory)
+    store.upsert_many([("a", [1, 0, 0]), ("b", [0, 1, 0]), ("c", [0, 0, 1])])
+    store.upsert_many([("a", [1, 1, 0])])
+    store.remove_many(["b"])
+    other = _store(directory)
+
+    store.compact()
+    assert store.generation == 1
+    assert store.tombstoned_ratio() == 0.0
+    assert sorted(store.ids) == ["a", "c"]
+    np.testing.assert_allclose(store.vector("a"), np.array([1, 1, 0]) / np.sqrt(2))
+
+    # Another worker resets onto the new generation on its next refresh
+    assert other.refresh()
+    assert other.generation == 1
+    assert sorted(other.ids) == ["a", "c"]
+    assert other.vector("b") is None
+
+
+def test_new_model_starts_an_empty_generation(directory):
+    _store(directory).upsert_many([("a", [1, 0, 0])])
+    store = _store(directory, model="other")
+    assert store.generation == 1
+    assert store.dim is None and len(store) == 0
+    assert store.upsert_many([("a", [1, 0, 0, 0])]) == [0]
+
+
+def test_index_follows_a_compaction_within_an_upsert(directory):
+    store = _store(directory)
+    index = IVFFlatIndex(store, ["genre"])
+    index.upsert_many(
+        [
+            {"_id": "a", "embedding": [1, 0, 0], "genre": "pop"},
+            {"_id": "b", "embedding": [0, 1, 0], "genre": "rock"},
+        ]
+    )
+    index.remove_many(["a"])
+    _store(directory).compact()
+
+    # The upsert itself picks up the new generation: "b" moved to row 0
+    index.upsert_many([{"_id": "c", "embedding": [0, 0, 1], "genre": "rock"}])
+    assert index.generation == store.generation == 1
+    assert len(index._lists) == len(store.ids) == 2
+    assert index.search([0, 0, 1], 2, filters={"genre": "rock"})[0][0] == "c"
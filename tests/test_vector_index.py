@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from services import vector_index
+from services.embedding_store import EmbeddingStore
+from services.quantized_index import QuantizedVectors, evaluate_recall
+from services.vector_index import IVFFlatIndex, _train_and_assign
+
+K = 10
+ROWS = 4000
+DIM = 32
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Clustered random embeddings, like tracks grouped by style"""
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(40, DIM))
+    vectors = centers[rng.integers(0, len(centers), ROWS)]
+    vectors += rng.normal(scale=1.0, size=vectors.shape)
+    store = EmbeddingStore(str(tmp_path), "model")
+    store.open()
+    store.upsert_many((f"t{row}", vector) for row, vector in enumerate(vectors))
+    return store
+
+
+def _recall(store: EmbeddingStore, search, samples: int = 100) -> float:
+    rng = np.random.default_rng(0)
+    found = 0
+    for row in rng.choice(len(store.ids), samples, replace=False):
+        vector = np.asarray(store.matrix[row])
+        mask = np.ones(len(store.ids), dtype=bool)
+        mask[row] = False
+        exact = {id for id, _ in store.search(vector, K, mask=mask)}
+        found += len(exact & {id for id, _ in search(vector, store.ids[row])})
+    return found / (samples * K)
+
+
+def test_ivf_recall(store, monkeypatch):
+    monkeypatch.setattr(vector_index, "EXACT_SEARCH_MAX_ROWS", 100)
+    index = IVFFlatIndex(store, [], nprobe=8)
+    index.refresh()
+    assert index.needs_training()
+    vectors, alive, generation = index.training_snapshot()
+    nlist = int(np.sqrt(alive.sum()))
+    centroids, assign = _train_and_assign(vectors, alive, nlist)
+    index.apply_training(centroids, assign, int(alive.sum()), generation)
+
+    recall = _recall(store, lambda vector, id: index.search(vector, K, exclude=[id]))
+    assert recall >= 0.95
+
+
+def test_quantized_recall_with_rerank(store):
+    quantized = QuantizedVectors(store)
+    quantized.extend(store.matrix[: len(store.ids)])
+
+    result = evaluate_recall(store, quantized, K, [K, 100], samples=100)
+    assert result["recall_by_shortlist"]["100"] >= 0.98
+    assert result["recall_by_shortlist"]["100"] >= result["recall_without_rerank"]